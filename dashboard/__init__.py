@@ -1,70 +1,166 @@
+import os
+import shutil
 import sys
+from collections import deque
 from datetime import datetime
 from functools import partial
 from subprocess import Popen, PIPE
-import json
 import traceback
 import math
 
-from PyQt5.QtGui import QFont, QCursor
-from PyQt5.QtCore import Qt
+from PyQt5.QtGui import QFont, QCursor, QTextCursor
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtWidgets import QMainWindow, QApplication, QWidget, QLayout, QLineEdit
 from PyQt5.QtWidgets import QLabel, QVBoxLayout, QHBoxLayout, QGroupBox, QGridLayout, QPushButton, QPlainTextEdit
 
-from vcc import settings, json_decoder, VCCError
+from vcc import settings, json_hook, VCCError
 from vcc.session import Session
+from vcc.models import SEFD
 from vcc.vws import get_client
 
 from processes import Timer, Get, MultiGet, ErrorMessage, make_text_box
 from processes.messenger import Messenger
+from vcc.messaging import Message, Dispatcher
 from dashboard.windows import StationMessage, SEFDs
 
 
+# Status of a station with log of events. Last max_records events are kept in memory as (utc, text).
+# Older events are written to file in chunks and loaded by viewer when scrolled to top.
+# Oldest chunks are removed from file when it is larger than max_file_size.
 class StatusWidget(QLineEdit):
 
-    def __init__(self, sta_id):
+    chunk_size, max_file_size = 64 * 1024, 8 * 1024 * 1024
+
+    def __init__(self, sta_id, path=None, max_records=500):
         super().__init__()
         self.sta_id = sta_id
         self.setReadOnly(True)
-        self.lines = [f'{datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")} - start log for {sta_id}']
-        self.viewer = None
+        self.records = deque([(datetime.utcnow(), f'start log for {sta_id}')])
+        self.path, self.max_records = path, max_records
+        self.viewer, self.older = None, 0  # Number of chunks not loaded in viewer
+        # Offset and size of chunks in file. Content of previous dashboard is split in chunks.
+        self.chunks = self.split_file() if path else []
+        self.trim_file()
         self.setCursor(QCursor(Qt.PointingHandCursor))
 
+    # Size of file with older events
+    def file_size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    # Split file in chunks of about chunk_size ending at end of line
+    def split_file(self):
+        chunks, offset, size = [], 0, self.file_size()
+        if size:
+            with open(self.path, 'rb') as file:
+                while offset < size:
+                    file.seek(offset + self.chunk_size)
+                    file.readline()
+                    end = min(file.tell(), size)
+                    chunks.append((offset, end - offset))
+                    offset = end
+        return chunks
+
+    # Remove oldest chunks so that file keeps about half of max_file_size
+    def trim_file(self):
+        if not self.path or (size := self.file_size()) <= self.max_file_size:
+            return
+        first = next(index for index, (offset, _) in enumerate(self.chunks)
+                     if size - offset <= self.max_file_size // 2 or index == len(self.chunks) - 1)
+        start, tmp_path = self.chunks[first][0], f'{self.path}.tmp'
+        with open(self.path, 'rb') as file, open(tmp_path, 'wb') as tmp:
+            file.seek(start)
+            shutil.copyfileobj(file, tmp)
+        os.replace(tmp_path, self.path)
+        self.chunks = [(offset - start, length) for (offset, length) in self.chunks[first:]]
+        self.older = max(0, self.older - first)
+
+    # Format an event
+    @staticmethod
+    def format(record):
+        return f'{record[0].strftime("%Y-%m-%d %H:%M:%S - ")}{record[1]}'
+
     def mousePressEvent(self, event):
         if self.viewer:
-            self.viewer.setPlainText('\n'.join(self.lines))
+            self.viewer.raise_()
+            self.viewer.activateWindow()
         else:
             self.viewer = QPlainTextEdit()
+            self.viewer.setReadOnly(True)
             self.viewer.setFont(QFont('monospace', 9))
             self.viewer.setMinimumWidth(450)
             self.viewer.setWindowTitle(f'{self.sta_id} - events')
-            self.viewer.setPlainText('\n'.join(self.lines))
+            self.viewer.setPlainText('\n'.join(map(self.format, self.records)))
+            self.viewer.moveCursor(QTextCursor.End)
+            self.older = len(self.chunks)
+            self.viewer.verticalScrollBar().valueChanged.connect(self.load_older)
             self.viewer.closeEvent = self.viewerCloseEvent
             self.viewer.show()
+            QTimer.singleShot(0, self.fill_viewer)  # Scroll bar range is known after layout
+
+    # Load older chunks while viewer cannot be scrolled, since scrolling to the top is what loads them
+    def fill_viewer(self):
+        if self.viewer and self.older and self.viewer.verticalScrollBar().maximum() == 0:
+            self.load_older(0)
+            QTimer.singleShot(0, self.fill_viewer)
+
+    # Insert previous chunk of events at top of viewer
+    def load_older(self, value):
+        if value > 0 or not self.older or not self.viewer:
+            return
+        self.older -= 1
+        offset, size = self.chunks[self.older]
+        with open(self.path, 'rb') as file:
+            file.seek(offset)
+            text = file.read(size).decode('utf-8')
+        bar = self.viewer.verticalScrollBar()
+        height = bar.maximum()
+        cursor = QTextCursor(self.viewer.document())
+        cursor.movePosition(QTextCursor.Start)
+        cursor.insertText(text)
+        bar.setValue(bar.maximum() - height)  # Keep same line at top
 
     def clean(self):
         if self.viewer:
             self.viewer.close()
 
     def add_text(self, utc, text):
-        record = f'{utc.strftime("%Y-%m-%d %H:%M:%S - ")}{text}'
-        self.lines.append(record)
+        self.records.append((utc, text))
+        if len(self.records) > self.max_records:
+            self.spill()
         if self.viewer:
-            self.viewer.appendPlainText(record)
+            self.viewer.appendPlainText(self.format((utc, text)))
+
+    # Write oldest quarter of events to file (dropped if no file)
+    def spill(self):
+        records = [self.records.popleft() for _ in range(max(1, self.max_records // 4))]
+        if not self.path:
+            return
+        data = ''.join(f'{self.format(record)}\n' for record in records).encode('utf-8')
+        offset = self.file_size()
+        with open(self.path, 'ab') as file:
+            file.write(data)
+        self.chunks.append((offset, len(data)))
+        self.trim_file()
 
     def viewerCloseEvent(self, event):
         self.viewer = None
 
+    # Display status without adding it to log
+    def show_status(self, utc, text):
+        super().setText(f'{utc.strftime("%H:%M:%S - ")}{text}')
+
     def setText(self, text, log_only=False):
         now = datetime.utcnow()
         self.add_text(now, text)
         if not log_only:
-            super().setText(f'{now.strftime("%H:%M:%S - ")}{text}')
+            self.show_status(now, text)
 
 
 # Class for dashboard application
 class Dashboard(QMainWindow):
 
+    router = Dispatcher()  # Functions processing messages by code
+
     def __init__(self, ses_id):
 
         self.full_name = 'VLBI dashboard V0.1'
@@ -73,11 +169,14 @@ class Dashboard(QMainWindow):
 
         self.network, self.sefds = [], {}
         self.timer, self.messages = None, None
+        self.dispatch = self.router.bind(self)
 
         self.session = self.get_session(ses_id)
 
         self.network = self.session.network
         self.station_scans = {}
+        # Row of each station and widgets of each row
+        self.station_rows, self.row_widgets = {}, {}
 
         super().__init__()
 
@@ -111,7 +210,9 @@ class Dashboard(QMainWindow):
         try:
             client = get_client('DB')
             info = client.get_inbox_credentials(self.session.code)  # Request queue information from web service
-            self.messenger = Messenger(info, self.process_messages)
+            # Many stations are sending messages at scan changes. Use larger prefetch window and batch acks
+            self.messenger = Messenger(info, self.process_messages, prefetch=50, ack_batch=10, reconnect=True,
+                                       credentials_provider=partial(client.get_inbox_credentials, self.session.code))
             self.messenger.start()
         except:
             ErrorMessage(self.full_name, 'Could not start messenger')
@@ -127,7 +228,7 @@ class Dashboard(QMainWindow):
             rsp = client.get(f'/sessions/{ses_id}')
             if not rsp:
                 raise VCCError(f'{ses_id} not found')
-            return Session(json_decoder(rsp.json()))
+            return Session(rsp.json(object_hook=json_hook))
         except VCCError as exc:
             ErrorMessage(self.full_name, str(exc), critical=True)
             sys.exit(0)
@@ -202,7 +303,9 @@ class Dashboard(QMainWindow):
         self.version_box.setText(version)
 
     # Process urgent message sent by a station
-    def process_urgent(self, headers, data):
+    @router.route('urgent')
+    def process_urgent(self, message):
+        headers, data = message.headers, message.data
         sta_id = data.get('station', headers.get('sender', None))
         if sta_id and (sta_id.capitalize() in self.network):
             sta_id = sta_id.capitalize()
@@ -211,16 +314,20 @@ class Dashboard(QMainWindow):
             StationMessage(self, headers, data)
 
     # Process master message send by the Operation centeer
-    def process_master(self, headers, data):
-        if data['session'].upper() == self.session.code:
+    @router.route('master')
+    def process_master(self, message):
+        if message.data['session'].upper() == self.session.code:
             self.update_session()
 
     # Process schedule message indicating that new schedule is available
-    def process_schedule(self, headers, data):
+    @router.route('schedule')
+    def process_schedule(self, message):
         self.get_schedule()
 
     # Process messages received from stations
-    def process_sta_info(self, headers, data):
+    @router.route('sta_info')
+    def process_sta_info(self, message):
+        headers, data = message.headers, message.data
         sta_id = data.get('station', headers.get('station', '__')).capitalize()
         ses_id = data.get('session', headers.get('session', '__')).upper()
 
@@ -238,21 +345,14 @@ class Dashboard(QMainWindow):
             self.update_station_info(sta_id, 'Sched', f'V{data["version"]}')
 
     # Process messages received trough the messaging system
-    def process_messages(self, headers, command):
-        # Decode command
-        if headers['format'] == 'json':
-            command = json.loads(command)
-            text = ', '.join([f'{key}={val}' for key, val in command.items()])
-        else:
-            text = command
-        code = headers['code']
-        msg, name = f'{code} {text}', f'process_{code}'
-        print('DB', msg)
-        print('DB', name)
-        self.messages.setText(msg)
+    def process_messages(self, headers, body):
+        message = Message(headers, body)
+        # Only last message received before repaint is rendered
+        self.pending_message = message
+        if not self.repaint_timer.isActive():
+            self.repaint_timer.start()
         # Call function for this specific code
-        if hasattr(self, name):
-            getattr(self, name)(headers, command)
+        self.dispatch(message)
         # Acknowledge message
         self.messenger.acknowledge_msg()
 
@@ -274,7 +374,13 @@ class Dashboard(QMainWindow):
 
     # Local function to make a Text box
     def _make_T(self, sta, text):
-        return StatusWidget(sta)
+        return StatusWidget(sta, self.get_log_path(sta))
+
+    # Get file where older events of a station are kept for this session
+    def get_log_path(self, sta):
+        folder = os.path.join(os.path.expanduser('~'), '.vcc', 'dashboard', self.session.code.lower())
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, f'{sta.lower()}.log')
 
     # Local function to make PushButton with specific text
     def _make_B(self, sta, text):
@@ -284,10 +390,12 @@ class Dashboard(QMainWindow):
 
     # Add a row with many widget to display station information
     def add_station_row(self, row, sta):
+        widgets = self.row_widgets[row] = {}
         for key, info in self.header.items():
             txt = sta.capitalize() if key == 'Station' else ''
-            widget = getattr(self, f'_make_{info[0]}')(sta, txt)
+            widgets[key] = widget = getattr(self, f'_make_{info[0]}')(sta, txt)
             self.station_info.addWidget(widget, row, info[1], 1, info[2])
+        self.station_rows[sta.capitalize()] = row
 
     # Make the box that will be use to display information from stations
     def make_monit_box(self):
@@ -303,6 +411,13 @@ class Dashboard(QMainWindow):
         groupbox = QGroupBox('Station Monitoring')
         groupbox.setStyleSheet("QGroupBox { font-weight: bold; } ")
         groupbox.setLayout(self.station_info)
+        self.monit_group = groupbox
+
+        # Updates from messages are applied together to reduce repaints
+        self.pending_updates, self.pending_message, self.repaint_timer = {}, None, QTimer(self)
+        self.repaint_timer.setSingleShot(True)
+        self.repaint_timer.setInterval(100)
+        self.repaint_timer.timeout.connect(self.apply_updates)
 
         grid = QGridLayout()
         grid.addWidget(groupbox)
@@ -310,29 +425,50 @@ class Dashboard(QMainWindow):
 
     # Update a widget in a row
     def update_widget(self, row, col_name, text):
-        #col = self.header[col_name][1]
-        #self.station_info.itemAtPosition(row,col).widget().setText(text)
+        self.pending_updates.pop((row, col_name), None)  # Newer than pending update
         self.get_widget(row, col_name).setText(text)
-
-    # Update a widget in a row
+        if col_name == 'Station':  # Keep index of station rows
+            for sta in [sta for sta, index in self.station_rows.items() if index == row and sta != text]:
+                self.station_rows.pop(sta)
+            self.station_rows[text] = row
+
+    # Keep update of a widget. Pending updates are applied after a short delay.
+    def queue_update(self, row, col_name, text):
+        self.pending_updates[(row, col_name)] = text
+        if not self.repaint_timer.isActive():
+            self.repaint_timer.start()
+
+    # Apply pending updates with one repaint
+    def apply_updates(self):
+        updates, self.pending_updates = self.pending_updates, {}
+        if self.pending_message:
+            self.messages.setText(str(self.pending_message))
+            self.pending_message = None
+        self.monit_group.setUpdatesEnabled(False)
+        try:
+            for (row, col_name), text in updates.items():
+                if not (widget := self.get_widget(row, col_name)):
+                    continue
+                if isinstance(widget, StatusWidget):  # Status was logged when received
+                    widget.show_status(*text)
+                else:
+                    widget.setText(text)
+        finally:
+            self.monit_group.setUpdatesEnabled(True)
+
+    # Get text of a widget in a row (including update not applied yet)
     def get_widget_text(self, row, col_name):
-        #col = self.header[col_name][1]
-        #return self.station_info.itemAtPosition(row,col).widget().text()
+        if (row, col_name) in self.pending_updates:
+            return self.pending_updates[(row, col_name)]
         return self.get_widget(row, col_name).text()
 
-    # Update a widget in a row
+    # Get a widget in a row
     def get_widget(self, row, col_name):
-        col = self.header[col_name][1]
-        item = self.station_info.itemAtPosition(row,col)
-        return item.widget() if item else None
+        return self.row_widgets.get(row, {}).get(col_name)
 
     # Get the rows associated with stations
     def get_station_list(self):
-        stations = {}
-        for row in range(1, self.station_info.rowCount()):
-            if item := self.station_info.itemAtPosition(row,0):
-                stations[item.widget().text()] = row
-        return stations
+        return dict(self.station_rows)
 
     # Clean the box with station information
     def clean_monit_box(self, sched=False):
@@ -348,33 +484,26 @@ class Dashboard(QMainWindow):
 
     # Check if a row has data
     def row_has_data(self, row):
-        return bool(self.station_info.itemAtPosition(row,0))
+        return row in self.row_widgets
 
-    # Update station information
+    # Update station information. Every status is logged when received, only the last one is displayed.
     def update_station_info(self, sta_id, col_name, text):
-        for row in range(1, self.station_info.rowCount()):
-            if item := self.station_info.itemAtPosition(row,0):
-                if sta_id == item.widget().text():
-                    self.update_widget(row, col_name, text)
-                    return
+        if row := self.station_rows.get(sta_id):
+            if col_name == 'Status':
+                utc = datetime.utcnow()
+                self.get_widget(row, col_name).add_text(utc, text)
+                text = (utc, text)
+            self.queue_update(row, col_name, text)
 
     # Update station information
     def update_station_log(self, sta_id, text):
-        for row in range(1, self.station_info.rowCount()):
-            if item := self.station_info.itemAtPosition(row,0):
-                if sta_id == item.widget().text():
-                    widget = self.get_widget(row, 'Status')
-                    widget.setText(text, True)
-                    return
+        if row := self.station_rows.get(sta_id):
+            self.get_widget(row, 'Status').setText(text, True)
 
     # Update station information
     def update_scans(self, sta_id, data):
-        if 'scan_id' in data:
-            for row in range(1, self.station_info.rowCount()):
-                if item := self.station_info.itemAtPosition(row,0):
-                    if sta_id == item.widget().text():
-                        self.update_widget(row, 'Scans', f'{data["scan_id"]}/{self.station_scans[sta_id]}')
-                        return
+        if 'scan_id' in data and (row := self.station_rows.get(sta_id)):
+            self.queue_update(row, 'Scans', f'{data["scan_id"]}/{self.station_scans[sta_id]}')
 
     # Remove row from stations
     def remove_monit_row(self, row):
@@ -382,6 +511,11 @@ class Dashboard(QMainWindow):
             if layout := self.station_info.itemAtPosition(row,col):
                 layout.widget().deleteLater()
                 self.station_info.removeItem(layout)
+        self.row_widgets.pop(row, None)
+        for sta in [sta for sta, index in self.station_rows.items() if index == row]:
+            self.station_rows.pop(sta)
+        for key in [key for key in self.pending_updates if key[0] == row]:
+            self.pending_updates.pop(key)
 
     # Start scheduler to make a new schedule
     def show_scheduler(self):
@@ -405,16 +539,20 @@ class Dashboard(QMainWindow):
         if sta not in self.sefds:
             self.sefds[sta] = {'wnd': None , 'data': None}
         sefd = self.sefds[sta]['data']
-        self.update_widget(row, 'SEFD', datetime.fromisoformat(sefd['observed']).strftime('%Y-%m-%d %H:%M') if sefd else 'No data')
+        self.update_widget(row, 'SEFD', sefd.observed.strftime('%Y-%m-%d %H:%M') if sefd else 'No data')
 
     # Update the monit box
     def update_monit_box(self):
         network = self.session.schedule.scheduled if self.session.schedule else self.network
         rows = self.get_station_list()  # Get row for each stations
-        for info in network:
-            sta, data = (info.capitalize(), None) if isinstance(info, str) else (info['station'].capitalize(), info)
-            if row := rows.get(sta, 0):
-                self.update_monit_row(row, sta, data)
+        self.monit_group.setUpdatesEnabled(False)  # Repaint once when all rows are updated
+        try:
+            for info in network:
+                sta, data = (info.capitalize(), None) if isinstance(info, str) else (info['station'].capitalize(), info)
+                if row := rows.get(sta, 0):
+                    self.update_monit_row(row, sta, data)
+        finally:
+            self.monit_group.setUpdatesEnabled(True)
 
     # Update the text in the status box and icon
     def update_start_status(self):
@@ -459,8 +597,8 @@ class Dashboard(QMainWindow):
 
     # Called when window is closing
     def closeEvent(self, event):
-        for row in range(1, self.station_info.rowCount()):
-            if widget := self.get_widget(row, 'Status'):
+        for widgets in self.row_widgets.values():
+            if widget := widgets.get('Status'):
                 widget.clean()
         try:
             print('Close messenger')
@@ -539,20 +677,22 @@ class Dashboard(QMainWindow):
                 action = (sta_id, f'/data/onoff/{sta_id}', params)
                 requests.append(action)
 
-        # Use MultiGet to request information from VWS
+        # Use MultiGet to request information from VWS. Use one bulk request if server supports it.
         if requests:
-            self._sefds = MultiGet('DB')
+            self._sefds = MultiGet('DB', concurrency=8)
             self._sefds.set_requests(requests, self.process_sefds, self.error_sefds, self.update_monit_box)
+            if len(requests) > 1:
+                self._sefds.set_bulk('/data/onoff', {'stations': ','.join(sta_id for (sta_id, _, _) in requests)})
             self._sefds.start()
 
     # Receive SEFDs and update monit box
     def process_sefds(self, sta_id, response, error):
         try:
             if response:
-                self.sefds[sta_id]['data'] = response.json()
-                sefd = self.sefds[sta_id]['data']
+                data = response.json()
+                self.sefds[sta_id]['data'] = sefd = SEFD(data) if data else None
                 if sefd:
-                    when = datetime.fromisoformat(sefd['observed']).strftime('%Y-%m-%d %H:%M')
+                    when = sefd.observed.strftime('%Y-%m-%d %H:%M')
                     self.update_station_info(sta_id, 'SEFD', when)
                     self.update_station_log(sta_id, f'uploaded onoff values dated {when}')
         except VCCError:
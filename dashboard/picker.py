@@ -3,7 +3,7 @@ from datetime import datetime, timedelta
 from functools import partial
 from subprocess import Popen, PIPE
 
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from PyQt5.QtWidgets import QMainWindow, QApplication, QWidget, QLayout
 from PyQt5.QtWidgets import QLabel, QVBoxLayout, QHBoxLayout, QGroupBox, QGridLayout, QPushButton
 
@@ -14,6 +14,23 @@ from vcc.session import Session
 from processes import Timer
 
 
+# Get sessions in different thread so that rows are displayed as soon as received. Stop when interrupted.
+# Requests have a timeout so that interruption is seen after timeout seconds at most.
+class SessionLoader(QThread):
+    found = pyqtSignal(int, object)
+    timeout = 5
+
+    def __init__(self, get_sessions, begin, end, master):
+        super().__init__()
+        self.get_sessions, self.args = get_sessions, (begin, end, master, self.timeout)
+
+    def run(self):
+        for index, session in self.get_sessions(*self.args):
+            if self.isInterruptionRequested():
+                break
+            self.found.emit(index, session)
+
+
 # Class for showing all sessions
 class SessionPicker(QMainWindow):
 
@@ -44,6 +61,7 @@ class SessionPicker(QMainWindow):
         self.init_pos()
 
         self.show()
+        self.loader.start()
 
         # Start timer to update information
         self.timer = Timer(self.on_timer)
@@ -67,20 +85,27 @@ class SessionPicker(QMainWindow):
         return hbox
 
     @staticmethod
-    def get_sessions(begin, end, master):
+    def get_sessions(begin, end, master, timeout=None):
         # Get session information from VLBI web service (vws)
         try:
             client = get_client('DB')
-            rsp = client.get('/sessions', params={'begin': begin, 'end': end, 'master': master})
+            rsp = client.get('/sessions', params={'begin': begin, 'end': end, 'master': master}, timeout=timeout)
             if rsp:
-                for ses_id in rsp.json():
-                    rsp = client.get(f'/sessions/{ses_id}')
-                    if rsp:
-                        session = Session(rsp.json())
-                        rsp = client.get(f'/schedules/{ses_id}', params={'select': 'summary'})
-                        if rsp:
-                            session.update_schedule(rsp.json())
-                        yield session
+                items = {}
+                for index, ses_id in enumerate(rsp.json()):
+                    items[(index, 'session')] = (f'/sessions/{ses_id}', None)
+                    items[(index, 'schedule')] = (f'/schedules/{ses_id}', {'select': 'summary'})
+                # Yield session as soon as session and schedule information are received
+                received = {}
+                for (index, name), rsp in client.get_many(items, timeout=timeout):
+                    received.setdefault(index, {})[name] = rsp
+                    if len(received[index]) == 2:
+                        info = received.pop(index)
+                        if info['session']:
+                            session = Session(info['session'].json())
+                            if info['schedule']:
+                                session.update_schedule(info['schedule'].json())
+                            yield index, session
         except VCCError:
             pass
 
@@ -101,18 +126,11 @@ class SessionPicker(QMainWindow):
         box.addWidget(QLabel('AC'), 0, 15)
         box.addWidget(QLabel('SCHED'), 0, 16)
 
-        for row, ses in enumerate(self.get_sessions(begin, end, master), 1):
-            box.addWidget(QLabel(ses.code.upper()), row, 0, 1, 2)
-            box.addWidget(QLabel(ses.start.strftime('%Y-%m-%d')), row, 3, 1, 2)
-            box.addWidget(QLabel(ses.start.strftime('%H:%M')), row, 5)
-            box.addWidget(QLabel(', '.join(ses.network)), row, 7, 1, 6)
-            box.addWidget(QLabel(ses.operations.upper()), row, 13)
-            box.addWidget(QLabel(ses.correlator.upper()), row, 14)
-            box.addWidget(QLabel(ses.analysis.upper()), row, 15)
-            box.addWidget(QLabel(ses.sched_version), row, 16)
-
-            box.addWidget(self.app_button('Make SKD', ses.code, 'settings.Scripts.scheduler'), row, 17)
-            box.addWidget(self.app_button('Monit', ses.code, 'settings.Scripts.dashboard'), row, 18)
+        self.session_box = box
+        # Rows are added by loader as soon as sessions are received
+        self.loader = SessionLoader(self.get_sessions, begin, end, master)
+        self.loader.found.connect(self.add_session_row)
+        self.loader.finished.connect(self.loader_finished)
 
         groupbox = QGroupBox()
         groupbox.setLayout(box)
@@ -120,6 +138,26 @@ class SessionPicker(QMainWindow):
         grid.addWidget(groupbox)
         return grid
 
+    # Thread is deleted by Qt when it has finished
+    def loader_finished(self):
+        if self.loader:
+            self.loader.deleteLater()
+            self.loader = None
+
+    def add_session_row(self, index, ses):
+        box, row = self.session_box, index + 1
+        box.addWidget(QLabel(ses.code.upper()), row, 0, 1, 2)
+        box.addWidget(QLabel(ses.start.strftime('%Y-%m-%d')), row, 3, 1, 2)
+        box.addWidget(QLabel(ses.start.strftime('%H:%M')), row, 5)
+        box.addWidget(QLabel(', '.join(ses.network)), row, 7, 1, 6)
+        box.addWidget(QLabel(ses.operations.upper()), row, 13)
+        box.addWidget(QLabel(ses.correlator.upper()), row, 14)
+        box.addWidget(QLabel(ses.analysis.upper()), row, 15)
+        box.addWidget(QLabel(ses.sched_version), row, 16)
+
+        box.addWidget(self.app_button('Make SKD', ses.code, 'settings.Scripts.scheduler'), row, 17)
+        box.addWidget(self.app_button('Monit', ses.code, 'settings.Scripts.dashboard'), row, 18)
+
     def launch_app(self, ses_id, app):
 
         command = f'{app} {ses_id}'
@@ -136,6 +174,9 @@ class SessionPicker(QMainWindow):
         sys.exit(self.app.exec_())
 
     def closeEvent(self,event):
+        if self.loader:  # Wait for last request so that thread is not destroyed while running
+            self.loader.requestInterruption()
+            self.loader.wait((SessionLoader.timeout + 1) * 1000)
         self.timer.stop()
 
 
@@ -1,5 +1,3 @@
-from datetime import datetime
-
 from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import QWidget, QMessageBox, QStyle, QLabel, QVBoxLayout, QGroupBox, QGridLayout
 
@@ -28,7 +26,7 @@ class SEFDs(QWidget):
     def __init__( self, parent, sefd):
         super().__init__(parent, Qt.Window)       # <<<=== Qt.Window
 
-        self.setWindowTitle(f'SEFD {sefd["sta_id"].capitalize()}')
+        self.setWindowTitle(f'SEFD {sefd.sta_id.capitalize()}')
         self.resize(300, 100)
 
         layout = QVBoxLayout()
@@ -38,12 +36,12 @@ class SEFDs(QWidget):
 
     def show_general_info(self, sefd):
 
-        observed = datetime.fromisoformat(sefd['observed']).strftime('%Y-%m-%d %H:%M')
+        observed = sefd.observed.strftime('%Y-%m-%d %H:%M')
         groupbox = QGroupBox()
         box = QGridLayout()
-        box.addWidget(QLabel(f'Source: {sefd["source"]}'), 0, 0, 1, 2)
-        box.addWidget(QLabel(f'Az: {sefd["azimuth"]}'), 0, 3)
-        box.addWidget(QLabel(f'El: {sefd["elevation"]}'), 0, 4)
+        box.addWidget(QLabel(f'Source: {sefd.source}'), 0, 0, 1, 2)
+        box.addWidget(QLabel(f'Az: {sefd.azimuth}'), 0, 3)
+        box.addWidget(QLabel(f'El: {sefd.elevation}'), 0, 4)
         box.addWidget(QLabel(observed), 0, 5, 1, 2)
         groupbox.setLayout(box)
         return groupbox
@@ -58,7 +56,7 @@ class SEFDs(QWidget):
         box.addWidget(HSeparator(5), 1, 0, 1, 6)
 
         names = ['device', 'input', 'polarization', 'frequency', 'tsys', 'sefd']
-        for row, info in enumerate(sefd['detectors'], 2):
+        for row, info in enumerate(sefd.detectors, 2):
             for col, name in enumerate(names):
                 box.addWidget(QLabel(str(info[name])), row, col)
         groupbox.setLayout(box)
@@ -1,5 +1,3 @@
-import json
-import re
 import os
 import signal
 import sys
@@ -7,12 +5,13 @@ import sys
 from vcc import settings, messaging
 from vcc.vws import get_client, VCCError
 from vcc.session import Session
+from vcc.schedule import get_store
 
 from PyQt5.QtWidgets import QApplication, QMessageBox
 
 class Listener:
 
-    extract_name = re.compile('.*filename=\"(?P<name>.*)\".*').match
+    router = messaging.Dispatcher()  # Functions processing messages by code
 
     def __init__(self, group_id, session):
 
@@ -24,6 +23,7 @@ class Listener:
 
         self.client = get_client(group_id)
         self.sta_id = settings.Signatures.NS[0]
+        self.dispatch = self.router.bind(self)
 
     def killed(self, sig, frame):
         self.messenger.close()
@@ -42,9 +42,10 @@ class Listener:
         msg.show()
 
         while True:
-            try:
+            try:  # Client reconnects by itself when connection is lost. Loop only if first connection failed.
                 config = self.client.get_inbox_credentials()
-                with messaging.RMQclient(config, multi=True) as self.messenger:
+                with messaging.RMQclient(config, multi=True, reconnect=keep_alive,
+                                         credentials_provider=self.client.get_inbox_credentials) as self.messenger:
                     self.messenger.monit(self.process_message, self.process_timeout, timeout=60)
                     break
             except KeyboardInterrupt:
@@ -58,25 +59,32 @@ class Listener:
                     return
 
     def process_message(self, headers, data):
-        # Ping sent by dashboard
-        code = headers['code']
-        if code == 'ping':
-            self.messenger.pong(self.sta_id, headers.get('reply_to'), 'Ok')
-        else:
-            # Decode message
-            data = json.loads(data) if headers.get('format', 'text') == 'json' else {}
-            text = ', '.join([f'{key}={val}' for key, val in data.items()]) if isinstance(data, dict) else str(data)
-            print(f'Message: {code} {text}')
-            if code == 'master':
-                for ses_id, status in data.items():
-                    self.session_has_changed(ses_id, status)
-                self.show_upcoming_sessions()
-            elif code == 'schedule':
-                self.download_schedule(data)
+        message = messaging.Message(headers, data)
+        if not self.dispatch(message):
+            print(f'Message: {message.code} not processed')
         # Always acknowledge message
         print('Calling acknowledge')
         self.messenger.acknowledge_msg()
 
+    # Ping sent by dashboard
+    @router.route('ping')
+    def process_ping(self, message):
+        self.messenger.pong(self.sta_id, message.headers.get('reply_to'), 'Ok')
+
+    # Status of sessions has changed
+    @router.route('master')
+    def process_master(self, message):
+        print(f'Message: {message}')
+        for ses_id, status in message.data.items():
+            self.session_has_changed(ses_id, status)
+        self.show_upcoming_sessions()
+
+    # New schedule is available
+    @router.route('schedule')
+    def process_schedule(self, message):
+        print(f'Message: {message}')
+        self.download_schedule(message.data)
+
     def session_has_changed(self, ses_id, status):
         # Get session information
         rsp = self.client.get(f'/sessions/{ses_id}')
@@ -103,16 +111,14 @@ class Listener:
     def download_schedule(self, data):
         ses_id = data['session'].lower()
         # Get session information (formats: ('skd', 'vex' 'skd|vex' 'vex|skd') default is 'skd|vex' skd first.
-        rsp = self.client.get(f'schedules/{ses_id}', params={'sta_id': self.sta_id, 'format': 'skd'})
-        if rsp:
-            found = self.extract_name(rsp.headers['content-disposition'])
-            if found:
-                filename = found['name']
-                path = os.path.join(settings.Folders.schedules, filename)
-                with open(path, 'wb') as f:
-                    f.write(rsp.content)
-
-                print(f'{filename} has been downloaded!')
+        try:
+            path = self.client.download(f'schedules/{ses_id}', settings.Folders.schedules,
+                                        params={'sta_id': self.sta_id, 'format': 'skd'})
+        except VCCError as exc:
+            print(f'Download of {ses_id} schedule failed', str(exc))
+            return
+        get_store().add(path)
+        print(f'{os.path.basename(path)} has been downloaded!')
 
 
 if __name__ == '__main__':
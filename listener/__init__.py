@@ -1,10 +1,10 @@
 import sys
-import json
 
 from PyQt5 import QtWidgets
 from PyQt5.QtCore import Qt
 
 from utils import settings
+from vcc.messaging import Message
 #from station.boss import Boss
 
 
@@ -101,19 +101,16 @@ class VCHlistener(QtWidgets.QMainWindow):
         print('STA', data)
         return
 
-        text = data
-        if headers['format'] == 'json':
-            data = json.loads(data)
-            text = ', '.join([f'{key}={val}' for key, val in data.items()])
-        msg = f'{headers["code"]} {text}'
+        message = Message(headers, data)
+        msg = str(message)
         self.display_message(msg)
 
-        if fnc := self.boss.get_task(headers['code']):
+        if fnc := self.boss.get_task(message.code):
             if self.automatic_mode:
-                fnc(headers['code'], data)
+                fnc(message.code, message.data)
                 self.messenger.accept_msg()
             else:
-                self.last_msg = (fnc, headers['code'], data)
+                self.last_msg = (fnc, message.code, message.data)
                 self.enable_msg_reply(True)
         else:
             self.boss.processor.add_text(':', f'{msg} not valid')
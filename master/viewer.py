@@ -8,9 +8,10 @@ from PyQt5.QtWidgets import QComboBox, QFrame, QMessageBox, QStyle, qApp
 from PyQt5.QtCore import Qt
 
 from master import COLUMNS
-from vcc import json_decoder, VCCError
+from vcc import json_hook, VCCError
 from vcc.vws import get_client
 from vcc.session import Session
+from vcc.models import Station
 
 
 # Popup window to display error message with icon.
@@ -179,7 +180,7 @@ class SessionViewer(QMainWindow):
             if not rsp:
                 raise VCCError(f'VCC response {rsp.status_code}\n{rsp.text}')
             ErrorMessage(f'{self.session.code.upper()} not updated\nSame information already on VCC'
-                         if json_decoder(rsp.json())[self.session.code] == 'same'
+                         if rsp.json(object_hook=json_hook)[self.session.code] == 'same'
                          else f'{self.session.code.upper()} updated', critical=False)
         except VCCError as exc:
             ErrorMessage(f'Problem updating {self.session.code}\n{str(exc)}')
@@ -188,7 +189,7 @@ class SessionViewer(QMainWindow):
         try:
             rsp = self.client.get(f'/sessions/{ses_id}')
             if rsp:
-                return Session(json_decoder(rsp.json()))
+                return Session(rsp.json(object_hook=json_hook))
         except VCCError:
             pass
         return Session({'code': ses_id})
@@ -197,7 +198,7 @@ class SessionViewer(QMainWindow):
         try:
             rsp = self.client.get(f'/stations')
             if rsp:
-                return [sta['code'].capitalize() for sta in json_decoder(rsp.json())]
+                return [Station(sta).code.capitalize() for sta in rsp.json()]
         except VCCError:
             pass
         return []
@@ -207,7 +208,7 @@ class SessionViewer(QMainWindow):
         try:
             rsp = self.client.get(url)
             if rsp:
-                [cb.addItem(item['code'].strip()) for item in json_decoder(rsp.json())]
+                [cb.addItem(item['code'].strip()) for item in rsp.json(object_hook=json_hook)]
         except VCCError:
             pass
         cb.setCurrentIndex(cb.findText(selection))
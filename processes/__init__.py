@@ -1,14 +1,19 @@
 import os
+import json
+from collections import deque
+from functools import partial
 from threading import Event
 from datetime import datetime, date
 
-from PyQt5.QtCore import QThread, Qt, pyqtSignal
+from PyQt5.QtCore import QObject, QThread, Qt, pyqtSignal
 from PyQt5.QtWidgets import qApp, QFrame, QWidget, QMessageBox, QVBoxLayout, QGridLayout, QGroupBox
 from PyQt5.QtWidgets import QLabel, QSizePolicy, QStyle, QLineEdit
 
-from vcc import settings, signature, VCCError
-from vcc.vws import get_client
+from vcc import settings, signature
 from vcc.session import Session
+from vcc.vws import make_response
+from vcc.schedule import get_store
+from processes.executor import get_executor
 
 
 # Class used to draw horizontal separator
@@ -89,7 +94,7 @@ class SessionsViewer(QWidget):
         self.check_schedules()
 
     def check_schedules(self):
-        self.gets = []
+        self.gets, self.indexers = [], []
         for ses in self.sessions:
             prc = Get(f'schedules/{ses["code"]}/exists')
             self.gets.append(prc)
@@ -138,15 +143,20 @@ class SessionsViewer(QWidget):
                 if data['file']:
                     # Check if file has been downloaded
                     path = os.path.join(settings.Folders.schedules, data['file'])
-                    if os.path.exists(path):
-                        with open(path) as sched:
-                            for line in sched:
-                                if line.startswith('SESSION:'):
-                                    self.schedules[code]['status'].setText(f'{line.split("|")[-1].strip()} downloaded')
+                    if os.path.exists(path):  # Reading information could index file. Done in worker thread.
+                        indexer = IndexSchedule(path)
+                        self.indexers.append(indexer)
+                        indexer.on_finish(code, self.show_schedule_info)
+                        indexer.start()
 
+    # Show version of downloaded schedule
+    def show_schedule_info(self, code, info, error):
+        if info and info.session:
+            self.schedules[code]['status'].setText(f'{info.version} downloaded')
 
-# Use different thread to get data from web service
-class Get(QThread):
+
+# Get data from web service using shared pool of threads
+class Get(QObject):
     finished = pyqtSignal(str, object, str)
 
     def __init__(self, group_id, path, params=None):
@@ -154,23 +164,27 @@ class Get(QThread):
 
         self.path, self.params = path, params
         self.group_id = group_id
-        self.command = None
+        self.command, self.handle = None, None
 
     def on_finish(self, command, function):
         self.command = command
         self.finished.connect(function)
 
-    def run(self):
-        try:
-            client = get_client(self.group_id)
-            response, error = client.get(self.path, self.params), None
-        except VCCError as exc:
-            response, error = None, str(exc)
+    # Submit request. Result is emitted on main thread.
+    def start(self):
+        self.handle = get_executor().get(self.group_id, self.path, self.params, self.done)
+
+    def done(self, response, error):
         self.finished.emit(self.command, response, error)
 
+    # Result will not be emitted
+    def cancel(self):
+        if self.handle:
+            self.handle.cancel()
+
 
-# Use different thread to get data from web service
-class Post(QThread):
+# Post data to web service using shared pool of threads
+class Post(QObject):
     finished = pyqtSignal(object, str)
 
     def __init__(self, group_id, path, data=None, files=None):
@@ -178,34 +192,96 @@ class Post(QThread):
 
         self.path, self.data, self.files = path, data, files
         self.group_id = group_id
+        self.handle = None
 
     def on_finish(self, function):
         self.finished.connect(function)
 
-    def run(self):
-        try:
-            client = get_client(self.group_id)
-            response, error = client.post(self.path, files=self.files, data=self.data), None
-        except VCCError as exc:
-            response, error = None, str(exc)
+    # Submit request. Result is emitted on main thread.
+    def start(self):
+        self.handle = get_executor().post(self.group_id, self.path, self.data, self.files, self.done)
+
+    def done(self, response, error):
         self.finished.emit(response, error)
 
+    # Result will not be emitted
+    def cancel(self):
+        if self.handle:
+            self.handle.cancel()
+
     @staticmethod
     def encoder(obj):
         if isinstance(obj, (date, datetime)):
             return obj.isoformat()
 
 
-# Use different thread to get data from web service
-class MultiGet(QThread):
+# Get information of schedule file from store using shared pool of threads. File is indexed if needed.
+class IndexSchedule(QObject):
+    finished = pyqtSignal(str, object, str)
+
+    def __init__(self, path, reindex=False):
+        super().__init__()
+
+        self.path, self.reindex = path, reindex
+        self.command, self.handle = None, None
+
+    def on_finish(self, command, function):
+        self.command = command
+        self.finished.connect(function)
+
+    # Submit indexing. Information is emitted on main thread.
+    def start(self):
+        fnc = get_store().add if self.reindex else get_store().info
+        self.handle = get_executor().submit(partial(fnc, self.path), self.done)
+
+    def done(self, info, error):
+        self.finished.emit(self.command, info, error or '')
+
+
+# Download file from web service to folder using shared pool of threads
+class Download(QObject):
+    finished = pyqtSignal(str, str, str)
+
+    def __init__(self, group_id, path, folder, params=None, filename=None):
+        super().__init__()
+
+        self.path, self.folder, self.params, self.filename = path, folder, params, filename
+        self.group_id = group_id
+        self.command, self.handle = None, None
+
+    def on_finish(self, command, function):
+        self.command = command
+        self.finished.connect(function)
+
+    # Submit download. Path of file is emitted on main thread.
+    def start(self):
+        self.handle = get_executor().download(self.group_id, self.path, self.folder, self.params, self.filename,
+                                              self.done)
+
+    def done(self, path, error):
+        self.finished.emit(self.command, path or '', error or '')
+
+    # Result will not be emitted
+    def cancel(self):
+        if self.handle:
+            self.handle.cancel()
+
+
+# Get many data from web service using shared pool of threads. At most concurrency requests are running.
+# processed is emitted as each response is received, finished when all are received.
+# A bulk request returning data for all keys is used first if server supports it.
+class MultiGet(QObject):
     processed = pyqtSignal(str, object, str)
     finished = pyqtSignal()
     error = pyqtSignal(str)
 
-    def __init__(self, group_id):
+    bulk_support = {}  # False for bulk path not supported by server
+
+    def __init__(self, group_id, concurrency=4):
         super().__init__()
-        self.group_id = group_id
-        self.actions = None
+        self.group_id, self.concurrency = group_id, concurrency
+        self.actions, self.bulk, self.handles, self.waiting = None, None, [], 0
+        self.queue, self.cancelled = deque(), False
 
     def do_nothing(self):
         pass
@@ -216,13 +292,70 @@ class MultiGet(QThread):
         self.error.connect(on_error)
         self.finished.connect(on_finished if on_finished else self.do_nothing)
 
-    def run(self):
+    # Set bulk request. Response must be a json dictionary with data for each key of actions.
+    # Only actions without their own params are taken from bulk response.
+    def set_bulk(self, path, params=None):
+        self.bulk = (path, params)
+
+    # Submit bulk request if supported or first requests
+    def start(self):
+        self.cancelled, self.handles = False, []
+        if not self.actions:
+            self.finished.emit()
+        elif self.bulk and self.bulk_support.get(self.bulk[0], True) and any(not action[2] for action in self.actions):
+            path, params = self.bulk
+            self.handles = [get_executor().get(self.group_id, path, params, self.bulk_done)]
+        else:
+            self.submit_all(self.actions)
+
+    # Submit individual requests. Next one is submitted when a response is received.
+    def submit_all(self, actions):
+        self.queue, self.waiting = deque(actions), len(actions)
+        for _ in range(min(self.concurrency, len(self.queue))):
+            self.submit_next()
+
+    # Submit next request in queue
+    def submit_next(self):
+        if self.queue and not self.cancelled:
+            key, path, params = self.queue.popleft()
+            self.handles.append(get_executor().get(self.group_id, path, params, partial(self.done, key)))
+
+    # Emit response. Stop on first error.
+    def done(self, key, response, error):
+        if error:
+            self.cancel()
+            self.error.emit(error)
+            return
+        self.processed.emit(key, response, '')
+        self.waiting -= 1
+        if self.waiting == 0:
+            self.finished.emit()
+        else:
+            self.submit_next()
+
+    # Emit a response for each key. Use individual requests if bulk request is not supported.
+    def bulk_done(self, response, error):
+        path = self.bulk[0]
+        if response is not None and (400 <= response.status_code < 500 or response.status_code == 501):
+            self.bulk_support[path] = False
         try:
-            client = get_client(self.group_id)
-            for (sta_id, path, params) in self.actions:
-                response = client.get(path, params)
-                self.processed.emit(sta_id, response, '')
+            data = response.json() if response and not error else None
+        except ValueError:
+            data = None
+        data = data if isinstance(data, dict) else {}
+        found = [action for action in self.actions if not action[2] and action[0] in data]
+        for (key, _, _) in found:
+            content = json.dumps(data[key]).encode('utf-8')
+            self.processed.emit(key, make_response(response.url, 200, {'content-type': 'application/json'},
+                                                   content), '')
+        # Keys with params or missing from bulk response use individual requests
+        if remaining := [action for action in self.actions if action not in found]:
+            self.submit_all(remaining)
+        else:
             self.finished.emit()
-        except VCCError as exc:
-            self.error.emit(str(exc))
 
+    # Results will not be emitted
+    def cancel(self):
+        self.cancelled = True
+        for handle in self.handles:
+            handle.cancel()
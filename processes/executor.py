@@ -0,0 +1,122 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+import json
+import os
+
+from PyQt5.QtCore import QObject, pyqtSignal
+
+from vcc.vws import get_client
+
+
+# Deliver results of requests on the thread that created the bridge (Qt main thread)
+class Bridge(QObject):
+    done = pyqtSignal(object)
+
+    def __init__(self):
+        super().__init__()
+        self.done.connect(self.deliver)
+
+    @staticmethod
+    def deliver(task):
+        task.deliver()
+
+
+# Request executed by the pool. Many handles could be waiting for the same request.
+class Task:
+    def __init__(self, key):
+        self.key, self.handles, self.future = key, [], None
+        self.result = (None, None)
+
+    # Call function of every handle that has not been cancelled with (response, error)
+    def deliver(self):
+        for handle in self.handles:
+            if not handle.cancelled and handle.callback:
+                handle.callback(*self.result)
+
+
+# Handle returned to caller of a request
+class Handle:
+    def __init__(self, executor, task, callback):
+        self.executor, self.task, self.callback = executor, task, callback
+        self.cancelled = False
+
+    # Result will not be delivered. Request is cancelled if nobody else is waiting for it and not started.
+    def cancel(self):
+        self.executor.cancel(self)
+
+    # Check if request has been executed
+    def done(self):
+        return self.task.future.done()
+
+
+# Bounded pool of threads executing web service requests with pooled VWS clients.
+# Identical GET requests that are already running are coalesced and get the same response.
+class RequestExecutor:
+    def __init__(self, max_workers=8):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='vws')
+        self.bridge, self.tasks, self.lock = Bridge(), {}, Lock()
+
+    # Execute function in pool. Callback (response, error) is called on main thread.
+    def submit(self, fnc, callback=None, key=None):
+        with self.lock:
+            if key and (task := self.tasks.get(key)):  # Same request is running. Wait for its result.
+                handle = Handle(self, task, callback)
+                task.handles.append(handle)
+                return handle
+            task = Task(key)
+            handle = Handle(self, task, callback)
+            task.handles.append(handle)
+            if key:
+                self.tasks[key] = task
+            task.future = self.pool.submit(self.execute, task, fnc)
+        return handle
+
+    # Execute function in pool thread and send result to main thread
+    def execute(self, task, fnc):
+        try:
+            task.result = (fnc(), None)
+        except Exception as exc:
+            task.result = (None, str(exc))
+        finally:
+            with self.lock:
+                if task.key and self.tasks.get(task.key) is task:
+                    self.tasks.pop(task.key)
+        self.bridge.done.emit(task)
+
+    # Cancel request for this handle
+    def cancel(self, handle):
+        with self.lock:
+            handle.cancelled = True
+            task = handle.task
+            if all(item.cancelled for item in task.handles) and task.future.cancel():
+                if task.key and self.tasks.get(task.key) is task:
+                    self.tasks.pop(task.key)
+
+    # GET request using pooled client for group_id
+    def get(self, group_id, path, params=None, callback=None):
+        key = ('GET', group_id, path.strip('/'), json.dumps(params, sort_keys=True, default=str))
+        return self.submit(lambda: get_client(group_id).get(path, params), callback, key)
+
+    # Download file to folder using pooled client for group_id. Callback receives path of file.
+    # Only downloads of same file to same destination are coalesced.
+    def download(self, group_id, path, folder, params=None, filename=None, callback=None):
+        key = ('DOWNLOAD', group_id, path.strip('/'), json.dumps(params, sort_keys=True, default=str),
+               os.path.abspath(folder), filename)
+        return self.submit(lambda: get_client(group_id).download(path, folder, params, filename), callback, key)
+
+    # POST request using pooled client for group_id. Posts are never coalesced.
+    def post(self, group_id, path, data=None, files=None, callback=None):
+        return self.submit(lambda: get_client(group_id).post(path, files=files, data=data), callback)
+
+
+_executor, _lock = None, Lock()
+
+
+# Get executor shared by all windows. First call must be done on Qt main thread.
+def get_executor():
+    global _executor
+
+    with _lock:
+        if _executor is None:
+            _executor = RequestExecutor()
+    return _executor
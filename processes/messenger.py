@@ -5,17 +5,17 @@ from vcc.messaging import RMQclient
 # Class to monit RabbitMQ and send messages using QThread
 class Messenger(QThread):
 
-    _msg = pyqtSignal(dict, str)
+    _msg = pyqtSignal(dict, object)
     _ack = pyqtSignal()
     _close = pyqtSignal()
     _send = pyqtSignal(str, str, str, object)
     _ping = pyqtSignal(str)
     _pong = pyqtSignal(str, str, object)
 
-    def __init__(self, info, processing_fnc):
+    def __init__(self, info, processing_fnc, **options):
         super().__init__()
 
-        self.client = RMQclient(info, multi=True)
+        self.client = RMQclient(info, multi=True, **options)
         self.client.connect()
 
         self._ack.connect(self.client.acknowledge_msg)
@@ -34,8 +34,9 @@ class Messenger(QThread):
     def stop(self):
         self._close.emit()
 
+    # Body is sent as received. Receiver decodes it only if needed (see vcc.messaging.Message)
     def process_msg(self, headers, body):
-        self._msg.emit(headers, body.decode('utf-8'))
+        self._msg.emit(headers, body)
 
     def acknowledge_msg(self):
         self._ack.emit()
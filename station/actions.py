@@ -0,0 +1,51 @@
+from collections import namedtuple
+from itertools import count
+import heapq
+
+# Declaring namedtuple()
+Action = namedtuple('Action', ['start', 'event', 'data'])
+
+
+# Actions ordered by start time. Actions with same start are executed in the order they have been added.
+class ActionQueue:
+    def __init__(self, tolerance=1.0):
+        self.heap, self.counter = [], count()
+        # Late firing statistics. Action is late if executed more than tolerance seconds after start.
+        self.tolerance = tolerance
+        self.fired, self.late, self.max_lateness, self.total_lateness = 0, 0, 0.0, 0.0
+
+    def __len__(self):
+        return len(self.heap)
+
+    # Add action
+    def push(self, action):
+        heapq.heappush(self.heap, (action.start, next(self.counter), action))
+
+    # Remove all actions
+    def clear(self):
+        self.heap = []
+
+    # Next action to execute
+    def peek(self):
+        return self.heap[0][2] if self.heap else None
+
+    # Remove and yield actions with start before utc in order of execution.
+    # Actions are removed one at a time so that nothing else is yielded after an action has cleared the queue.
+    def pop_due(self, utc):
+        while self.heap and self.heap[0][0] < utc:
+            start, _, action = heapq.heappop(self.heap)
+            self.record((utc - start).total_seconds())
+            yield action
+
+    # Keep statistics on late firing
+    def record(self, lateness):
+        self.fired += 1
+        self.total_lateness += lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        if lateness > self.tolerance:
+            self.late += 1
+
+    # Late firing statistics as dictionary
+    def metrics(self):
+        return {'fired': self.fired, 'late': self.late, 'max_lateness': self.max_lateness,
+                'avg_lateness': self.total_lateness / self.fired if self.fired else 0.0}
@@ -1,9 +1,7 @@
 from threading import Event
 from datetime import datetime, timedelta
 import enum
-import re
 import os
-import json
 import math
 
 from PyQt5.QtWidgets import QWidget, QLabel, QLineEdit, QHBoxLayout, QStyle, QPushButton,\
@@ -14,11 +12,13 @@ from PyQt5.QtTest import QTest
 
 from requests import codes as HttpCodes
 
-from utils import settings, get_schedule_info
+from vcc import settings
 from tools import get_credentials
-from processes import Timer, make_text_box, Session, SessionsViewer, Get, Post
+from processes import Timer, make_text_box, Session, SessionsViewer, Get, Post, Download, IndexSchedule
 from station.processor import Processor
 from processes.messenger import Messenger
+from vcc.messaging import Message, Dispatcher
+from vcc.spool import get_spool
 from processes.accept import Accepting
 
 
@@ -67,38 +67,43 @@ class Header(QWidget):
 # Class Boss that control actions
 class Boss(QLabel):
 
+    router = Dispatcher()  # Functions processing messages by code. Other codes are sent to processor.
+
     update_rate = timedelta(seconds=60)
     one_day = timedelta(days=1)
     one_hour = timedelta(hours=1)
     fifteen_minutes = timedelta(minutes=15)
 
-    get_name = re.compile('.*filename=\"(?P<name>.*)\".*').match
-
     def __init__(self, parent):
         super().__init__('')
 
         self.parent = parent
 
         self.commands = ['onoff', 'load', 'urgent', 'halt', 'resume', 'terminate', 'plog']
-        self.functions = {'master': self.get_upcoming_session, 'schedule': self.get_schedule,
-                          'ping': self.send_status}
-
         self.automatic_mode, self.accept_msg = False, None
 
         self.sta_id = settings.Identity.code
 
         self.processor = Processor(self.sta_id, self)
+        self.functions = self.router.bind(self, default=self.processor.do)
 
         self.title = f'{self.sta_id} - {settings.Identity.name}'
 
         self.session, self.wnd_sessions = None, None
         self.last_update = datetime.utcnow() - self.update_rate
 
-        self.actions = {}
+        self.actions, self.pending_messages = {}, []
 
     # Display received message
+    # Keep message until next timer update. Text of Message is rendered when it is displayed.
     def display_message(self, msg):
-        self.messages.append(f'{datetime.utcnow().isoformat(sep=" ", timespec="milliseconds")}: {msg}')
+        self.pending_messages.append((datetime.utcnow(), msg))
+
+    # Display messages received since last timer update
+    def show_pending_messages(self):
+        messages, self.pending_messages = self.pending_messages, []
+        for (utc, msg) in messages:
+            self.messages.append(f'{utc.isoformat(sep=" ", timespec="milliseconds")}: {msg}')
 
     @property
     def label_widget(self):
@@ -168,7 +173,7 @@ class Boss(QLabel):
 
     # Get function that will process a specific task
     def get_task(self, name):
-        return self.functions.get(name, self.processor.do)
+        return self.functions.get(name)
 
     # Toggle automatic mode when button is press
     def automatic_mode_changed(self):
@@ -184,7 +189,11 @@ class Boss(QLabel):
         # Start messenger
         if info := get_credentials(): # Request queue information from web service
             self.display_message('connected to VOC messenger. Waiting for messages')
-            self.messenger = Messenger(info, self.process_messages)
+            # Station information is sent in bursts. Publish them in confirmed batches
+            # Messages are kept on disk when link is down and published after reconnect
+            self.messenger = Messenger(info, self.process_messages, confirm=True, batch_size=20, batch_delay=0.2,
+                                       spool=get_spool(self.sta_id), reconnect=True,
+                                       credentials_provider=get_credentials)
             self.messenger.start()
         else:
             self.display_message('Could not connect to VOC messenger')
@@ -196,6 +205,7 @@ class Boss(QLabel):
     # Update display for timer
     def update_timer(self, utc):
         self.setText(utc.strftime('%Y-%m-%d %H:%M:%S UTC'))
+        self.show_pending_messages()
 
         self.update_session_info(utc)
 
@@ -218,6 +228,7 @@ class Boss(QLabel):
     def remove_action(self, name):
         self.actions.pop(name, '')
 
+    @router.route('master')
     def get_upcoming_session(self, action=None, data=None):
 
         print('GET SESSIONS')
@@ -225,6 +236,7 @@ class Boss(QLabel):
         self.get.on_finish(action, self.process_coming_session)
         self.get.start()
 
+    @router.route('schedule')
     def get_schedule(self, action, data=None):
 
         self.processor.add_text('$', 'before wait')
@@ -233,9 +245,10 @@ class Boss(QLabel):
         self.processor.add_text('$', 'after wait')
 
         ses_id = data['session'].lower()
-        self.get = Get(f'schedules/{ses_id}', params={'sta_id': self.sta_id, 'format': 'skd'})
-        self.get.on_finish(action, self.save_new_schedule)
-        self.get.start()
+        self.download = Download('NS', f'schedules/{ses_id}', settings.Folders.schedules,
+                                 params={'sta_id': self.sta_id, 'format': 'skd'})
+        self.download.on_finish(action, self.save_new_schedule)
+        self.download.start()
 
     def process_coming_session(self, action, response, error):
 
@@ -260,23 +273,24 @@ class Boss(QLabel):
         if action:
             self.processor.add_text(':', f'{action} {result}')
 
-    def save_new_schedule(self, msg, response, error):
-        result = f'{msg} failed'
-        if not error and response and response.status_code == HttpCodes.ok:
-            if found := self.get_name(response.headers['content-disposition']):
-                filename = found['name']
-                path = os.path.join(settings.Folders.schedules, filename)
-                with open(path, 'wb') as f:
-                    f.write(response.content)
-                result = f'{filename} downloaded'
-                if self.automatic_mode:
-                    self.processor.add_text('&', 'receive schedule')
-                    ses_id, start, end, version = get_schedule_info(path)
-                    if ses_id and end > datetime.utcnow():
-                        data = {'session': ses_id, 'time': start - timedelta(seconds=305)}
-                        self.processor.do('auto', data)
-
-        self.processor.add_text(':', result)
+    def save_new_schedule(self, msg, path, error):
+        if error or not path:
+            self.processor.add_text(':', f'{msg} failed {error}' if error else f'{msg} failed')
+            return
+        self.processor.add_text(':', f'{os.path.basename(path)} downloaded')
+        # Index schedule in worker thread
+        self.indexer = IndexSchedule(path, reindex=True)
+        self.indexer.on_finish(msg, self.schedule_indexed)
+        self.indexer.start()
+
+    def schedule_indexed(self, msg, info, error):
+        if error:
+            self.processor.add_text(':', f'{msg} could not index schedule {error}', flag=True)
+        elif self.automatic_mode:
+            self.processor.add_text('&', 'receive schedule')
+            if info.session and info.end > datetime.utcnow():
+                data = {'session': info.session, 'time': info.start - timedelta(seconds=305)}
+                self.processor.do('auto', data)
         self.update_sessions()
 
     def update_status(self, msg, color=Color.black):
@@ -313,7 +327,7 @@ class Boss(QLabel):
         input = self.oper_input.text().lstrip().lower()
         self.oper_input.setText('')
         command = input.split()[0]
-        self.functions.get(command, self.processor.do)(command, input.replace(command, '').strip())
+        self.functions.get(command)(command, input.replace(command, '').strip())
 
     def show_sessions(self, sessions):
         try:
@@ -333,6 +347,7 @@ class Boss(QLabel):
         print('CLOSE VIEWER')
         self.wnd_sessions = None
 
+    @router.route('ping')
     def send_status(self, ):
         self.messenger.pong(settings.get_user_id(), 'Ok')
 
@@ -343,29 +358,25 @@ class Boss(QLabel):
         self.messenger.acknowledge_msg()
         return True
 
-    def process_messages(self, headers, data):
-        print('MSG', headers, data)
+    def process_messages(self, headers, body):
+        print('MSG', headers)
         # Check if message is 'vlbi' or a ping
         if self.is_ping(headers):
             return
-        # Decode message
-        if headers.get('format', 'text') == 'json':
-            data = json.loads(data)
-        text = ', '.join([f'{key}={val}' for key, val in data.items()]) if isinstance(data, dict) else str(data)
-        msg = f'{headers["code"]} {text}'
+        message = Message(headers, body)
 
         # Call appropriate function
-        if fnc := self.get_task(headers['code']):
-            self.display_message(msg)
+        if fnc := self.get_task(message.code):
+            self.display_message(message)
             if self.automatic_mode:
-                fnc(headers['code'], data)
+                fnc(message.code, message.data)
                 self.messenger.acknowledge_msg()
             else:
-                self.last_msg = (fnc, headers['code'], data)
+                self.last_msg = (fnc, message.code, message.data)
                 self.enable_msg_reply(True)
                 #self.show_accept_message(msg)
         else:  # Remove message since there nothing to do with it.
-            self.display_message(':', f'{msg} not valid')
+            self.display_message(f'{message.code} not valid')
             self.messenger.acknowledge_msg()
 
     def decode_onoff_record(self, line):
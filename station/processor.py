@@ -1,5 +1,5 @@
-from collections import namedtuple
 from datetime import datetime, timedelta
+from functools import partial
 import os
 
 from PyQt5.QtWidgets import QTextEdit, QCheckBox, QPushButton, QGridLayout, QGroupBox
@@ -8,9 +8,9 @@ from requests import codes as HttpCodes
 
 from utils import settings
 from processes import Timer, Post
-
-# Declaring namedtuple()
-Action = namedtuple('Action',['start','event','data'])
+from processes.executor import get_executor
+from station.actions import Action, ActionQueue
+from vcc.schedule import get_store
 
 
 class Processor(QTextEdit):
@@ -26,7 +26,8 @@ class Processor(QTextEdit):
 
         self.boss = boss
         self.sta_id, self.ses_id, self.halted = sta_id.lower(), 'unknown', False
-        self.actions, self.to_do, self.next_action = [], {}, None
+        self.actions, self.to_do = ActionQueue(), {}
+        self.load_id = 0  # Schedule loaded by previous load is ignored if it is received after a new load
 
         self.auto_loaded = {}
         self.log = None
@@ -46,9 +47,11 @@ class Processor(QTextEdit):
             self.log.close()
             self.log = None
 
-    # Stop timer
+    # Stop timer and ignore schedule being loaded
     def stop(self):
         self.timer.stop()
+        self.actions.clear()
+        self.load_id += 1
 
     # Insert the action into the to_do list
     def do(self, action, data=''):
@@ -64,11 +67,9 @@ class Processor(QTextEdit):
                 self.add_text(';', f'{action}{" " if text else ""}{text}')
             getattr(self, key)(action, data, utc)
 
-        # Execute commands from schedule
-        if self.next_action and utc > self.next_action.start:
-            action = self.next_action
-            self.next_action = self.actions.pop(0) if self.actions else None
-
+        # Execute all due commands from schedule. Actions are dropped while halted since the schedule continues
+        # from current time when resumed. Nothing else is executed once terminate has cleared the queue.
+        for action in self.actions.pop_due(utc):
             if not self.halted:
                 getattr(self, action.event)(action.event, action.data, utc)
 
@@ -148,9 +149,12 @@ class Processor(QTextEdit):
 
     def terminate(self, action, data, utc):
 
-        if self.next_action:
-            self.next_action = None
+        self.actions.clear()
+        self.load_id += 1  # Schedule being loaded must not add actions after terminate
         self.add_text(':', f'{action}')
+        metrics = self.actions.metrics()
+        self.add_text(':', f'{metrics["fired"]} actions executed, {metrics["late"]} late, '
+                           f'max delay {metrics["max_lateness"]:.3f}s, mean delay {metrics["avg_lateness"]:.3f}s')
         self.msg('sta_info', {'status': 'schedule terminated', 'session': self.ses_id})
         self.close_log()
 
@@ -190,20 +194,6 @@ class Processor(QTextEdit):
         self.halted = False
         self.msg('sta_info', {'status': 'schedule resume', 'session': self.ses_id})
 
-    def decode_scan(self, line, sources):
-        start, src_name, scan_name, dur, stations = line.split('|')
-        src_name = src_name.split('=')[-1]
-        scan_name = scan_name.split('=')[-1]
-        duration = int(dur.split('=')[-1])
-        stations = stations.lower().split()
-        start = datetime.strptime(start.strip(), '%Y-%m-%d %H:%M:%S')
-        end = start + timedelta(seconds=duration)
-        src = sources[src_name]
-        scan = f'{scan_name},{self.ses_id},{self.sta_id},{duration},{duration}'
-        status = f'{scan_name},ok'
-
-        return start, end, src, scan, status, stations
-
     def auto(self, action, data, utc):
         session = data['session']
         if utc < data['time']:
@@ -220,60 +210,50 @@ class Processor(QTextEdit):
         session = session.lower()
         self.open_log(session)
 
-        self.actions = []
+        self.actions, self.load_id = ActionQueue(), self.load_id + 1
         for ext in ['.skd', '.vex']:
             path = os.path.join(settings.Folders.schedules, f'{session}{ext}')
             if os.path.exists(path):
                 self.ses_id = session
-                sources = {}
-                scan_id = 0
-                now, src_time = datetime.utcnow(), None
-                expr_start = now
-                with open(path) as file:
-                    for line in file:
-                        key, info = line.split(':', 1)
-                        if key == 'SESSION':
-                            expr_start = datetime.strptime(line.split('|')[1], '%Y-%m-%d %H:%M:%S')
-                        elif key == 'SOURCE':
-                            code, name, rad, dec, epoch = info[1:10], info[10:19], info[19:35], info[36:55], info[55:62]
-                            name = code.strip() if name.startswith('$') else name.strip()
-                            rad, dec, epoch = float(rad.replace(' ', '')), float(dec.replace(' ', '')), epoch.strip()
-                            sources[name] = f'{name},{rad:.2f},{dec:.2f},{epoch}'
-                        elif key == 'SCAN':
-                            start, end, src, scan, status, stations = self.decode_scan(info, sources)
-                            if self.sta_id in stations:
-                                scan_id += 1
-                                if start > now:
-                                    src_time = src_time if src_time else start - timedelta(seconds=60)
-                                    self.actions.append(Action(src_time, 'source', src))
-                                    self.actions.append(Action(start, 'scan_name', f'{scan}|{scan_id}'))
-                                    self.actions.append(Action(end, 'scan_end', status))
-                                    scr_time = end
-
-                    # Run onoff if automated
-                    print('ADDING READY', expr_start, now)
-                    if expr_start > now:
-                        start = max(now, expr_start-timedelta(seconds=120))
-                        print('ADDED READY')
-                        self.actions.insert(0, Action(start, 'ready', ''))
-                    if action == 'auto':
-                        print('AUTO', expr_start - timedelta(seconds=300), now)
-                        if expr_start - timedelta(seconds=300) > now:
-                            self.actions.insert(0, Action(utc, 'onoff', 'before'))
-                        end += timedelta(seconds=10)
-                        self.actions.append(Action(end, 'onoff', 'after'))
-                    # Add terminate 5 second after last
-                    end += timedelta(seconds=5)
-                    self.actions.append(Action(end, 'terminate', ''))
-                    # Activate the processing by setting next_action
-                    self.next_action = self.actions.pop(0)
-                    print('ACTION 0', len(self.actions), self.actions[0].event, self.actions[0].start)
-                    print('ACTION 1', len(self.actions), self.actions[0].event, self.actions[-1].start)
+                # Read scans from schedule store in worker thread. Actions are created when it is done.
+                get_executor().submit(partial(get_store().load, path, self.sta_id),
+                                      partial(self.schedule_parsed, self.load_id, action, utc))
                 break
         else:
             self.add_text(':', f'No schedule file for {session}')
 
-
-
-
-
+    # Make actions for scans of this station
+    def schedule_parsed(self, load_id, action, utc, schedule, error):
+        if load_id != self.load_id:  # Another schedule has been loaded since
+            return
+        if error:
+            self.add_text(':', f'could not read schedule {error}', flag=True)
+            return
+        now, src_time = datetime.utcnow(), None
+        expr_start, end = schedule.start if schedule.start else now, schedule.end if schedule.end else now
+        for scan in schedule.scans:
+            if scan.start > now:
+                src_time = src_time if src_time else scan.start - timedelta(seconds=60)
+                self.actions.push(Action(src_time, 'source', schedule.sources[scan.source]))
+                info = f'{scan.name},{self.ses_id},{self.sta_id},{scan.duration},{scan.duration}'
+                self.actions.push(Action(scan.start, 'scan_name', f'{info}|{scan.index}'))
+                self.actions.push(Action(scan.end, 'scan_end', f'{scan.name},ok'))
+                src_time = scan.end  # Next source is sent at end of this scan
+
+        # Run onoff if automated
+        print('ADDING READY', expr_start, now)
+        if expr_start > now:
+            start = max(now, expr_start-timedelta(seconds=120))
+            print('ADDED READY')
+            self.actions.push(Action(start, 'ready', ''))
+        if action == 'auto':
+            print('AUTO', expr_start - timedelta(seconds=300), now)
+            if expr_start - timedelta(seconds=300) > now:
+                self.actions.push(Action(utc, 'onoff', 'before'))
+            end += timedelta(seconds=10)
+            self.actions.push(Action(end, 'onoff', 'after'))
+        # Add terminate 5 second after last
+        end += timedelta(seconds=5)
+        self.actions.push(Action(end, 'terminate', ''))
+        first = self.actions.peek()
+        print('ACTION 0', len(self.actions), first.event, first.start)
@@ -0,0 +1,54 @@
+import os
+import sys
+import tempfile
+
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget
+
+from dashboard import Dashboard, StatusWidget
+
+
+# Dashboard with one station row and no session, messenger or timer
+def make_dashboard(sta_id):
+    dashboard = Dashboard.__new__(Dashboard)
+    QMainWindow.__init__(dashboard)
+    dashboard.station_rows, dashboard.row_widgets = {sta_id: 1}, {1: {'Status': StatusWidget(sta_id)}}
+    dashboard.pending_updates, dashboard.pending_message = {}, None
+    dashboard.repaint_timer, dashboard.monit_group = QTimer(dashboard), QWidget()
+    dashboard.repaint_timer.setSingleShot(True)
+    dashboard.repaint_timer.timeout.connect(dashboard.apply_updates)
+    return dashboard
+
+
+if __name__ == '__main__':
+    app = QApplication(sys.argv)
+
+    # Statuses received before repaint are all logged. Only the last one is displayed.
+    dashboard = make_dashboard('Is')
+    dashboard.update_station_info('Is', 'Status', 'scan_end 152-1800')
+    dashboard.update_station_info('Is', 'Status', 'source 0059+581')
+    dashboard.apply_updates()
+    widget = dashboard.get_widget(1, 'Status')
+    assert [text for (_, text) in widget.records][-2:] == ['scan_end 152-1800', 'source 0059+581']
+    assert widget.text().endswith(' - source 0059+581')
+    print('status log ok')
+
+    # Events of previous dashboard are split in chunks ending at end of line. File is trimmed when too large.
+    path = os.path.join(tempfile.mkdtemp(), 'is.log')
+    with open(path, 'w') as file:
+        for index in range(20000):
+            print(f'2022-06-01 18:00:00 - status message {index:05d}', file=file)
+    widget = StatusWidget('Is', path)
+    assert sum(length for (_, length) in widget.chunks) == os.path.getsize(path)
+    assert all(length <= widget.chunk_size + 64 for (_, length) in widget.chunks)
+    with open(path, 'rb') as file:
+        for (offset, length) in widget.chunks:
+            file.seek(offset)
+            assert file.read(length).endswith(b'\n')
+    StatusWidget.max_file_size = 256 * 1024
+    widget = StatusWidget('Is', path)
+    assert os.path.getsize(path) <= StatusWidget.max_file_size // 2 + StatusWidget.chunk_size
+    assert widget.chunks[0][0] == 0 and sum(length for (_, length) in widget.chunks) == os.path.getsize(path)
+    with open(path) as file:
+        assert file.readline().startswith('2022-06-01') and file.readlines()[-1].endswith('19999\n')
+    print('spill file ok')
@@ -0,0 +1,46 @@
+import json
+import timeit
+from datetime import datetime, timedelta
+
+from vcc import json_decoder, json_hook, json_loads
+
+
+# Decoder used before the quick check on iso format
+def old_json_decoder(obj):
+    try:
+        return datetime.fromisoformat(obj)
+    except:
+        if isinstance(obj, dict):
+            return {name: old_json_decoder(item) for name, item in obj.items()}
+        if isinstance(obj, list):
+            return [old_json_decoder(item) for item in obj]
+    return obj
+
+
+# Make a schedule summary similar to /schedules/{id}?select=summary for a large network
+def make_schedule(nbr_stations=40, nbr_scans=5000):
+    start = datetime(2022, 6, 1, 18)
+    stations = [f'S{index:d}'[-2:] for index in range(nbr_stations)]
+    scheduled = [{'station': sta, 'version': 1, 'nbr_scans': nbr_scans // 2, 'updated': start.isoformat()}
+                 for sta in stations]
+    scans = [{'name': f'152-{index:04d}', 'start': (start + timedelta(seconds=30*index)).isoformat(),
+              'source': '0059+581', 'duration': 30, 'stations': stations[:4]} for index in range(nbr_scans)]
+    return json.dumps({'code': 'r41050', 'version': 1, 'updated': start.isoformat(), 'observing': stations,
+                       'scheduled': scheduled, 'scans': scans})
+
+
+if __name__ == '__main__':
+    text = make_schedule()
+    assert old_json_decoder(json.loads(text)) == json_decoder(json.loads(text)) == json.loads(text, object_hook=json_hook)
+    # Times in nested lists and in top level list
+    for data in [{'windows': [['2022-06-01T18:00:00', '2022-06-02T18:00:00'], []]},
+                 ['2022-06-01T18:00:00', {'updated': '2022-06-01T18:00:00'}, [['2022-06-01']]]]:
+        assert old_json_decoder(data) == json_decoder(data) == json_loads(json.dumps(data)), data
+
+    number = 20
+    for name, fnc in [('old json_decoder', lambda: old_json_decoder(json.loads(text))),
+                      ('json_decoder', lambda: json_decoder(json.loads(text))),
+                      ('json_decoder fields', lambda: json_decoder(json.loads(text), fields={'start', 'updated'})),
+                      ('object_hook', lambda: json.loads(text, object_hook=json_hook))]:
+        dt = timeit.timeit(fnc, number=number) / number
+        print(f'{name:20s} {dt * 1000:8.2f} ms')
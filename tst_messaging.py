@@ -0,0 +1,84 @@
+import queue
+import threading
+from types import SimpleNamespace
+
+from vcc.messaging import RMQclient, make_message
+
+
+# Connection processing callbacks in the thread consuming messages (like pika BlockingConnection)
+class FakeConnection:
+    def __init__(self):
+        self.events, self.is_open, self.channels = queue.Queue(), True, []
+
+    def channel(self):
+        self.channels.append(FakeChannel(self))
+        return self.channels[-1]
+
+    def add_callback_threadsafe(self, callback):
+        self.events.put(callback)
+
+    def call_later(self, delay, callback):
+        return callback
+
+    def remove_timeout(self, timeout_id):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+# Channel recording acknowledgements
+class FakeChannel:
+    def __init__(self, connection):
+        self.connection, self.acks, self.on_message, self.consuming = connection, [], None, False
+        self.is_open, self.is_closed = True, False
+
+    def basic_qos(self, prefetch_count):
+        pass
+
+    def basic_consume(self, queue, on_message_callback, auto_ack):
+        self.on_message = on_message_callback
+
+    def start_consuming(self):
+        self.consuming = True
+        while self.consuming:
+            self.connection.events.get()()
+
+    def stop_consuming(self):
+        self.consuming = False
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.acks.append((delivery_tag, multiple))
+
+    def close(self):
+        self.is_open, self.is_closed = False, True
+
+    # Message delivered by broker
+    def deliver(self, tag):
+        headers, body = make_message('is', 'sta_info', {'status': f'message {tag}'})
+        properties = SimpleNamespace(headers=headers, reply_to=None)
+        self.connection.add_callback_threadsafe(lambda: self.on_message(self, SimpleNamespace(delivery_tag=tag),
+                                                                        properties, body))
+
+
+if __name__ == '__main__':
+    # Messages processed before close are acknowledged before the connection is closed
+    client = RMQclient(SimpleNamespace(exchange='VLBI', queue='inbox'), multi=True, prefetch=10, ack_batch=10,
+                       ack_delay=60)
+    client.connection = connection = FakeConnection()
+    received = queue.Queue()
+    thread = threading.Thread(target=client.monit, args=(lambda headers, body: received.put(body),))
+    thread.start()
+    while not connection.channels:
+        pass
+    channel = connection.channels[0]
+    for tag in (1, 2, 3):
+        channel.deliver(tag)
+    for _ in range(2):
+        received.get(timeout=5)
+        client.acknowledge_msg()
+    client.close()
+    thread.join(timeout=5)
+    assert not thread.is_alive() and not connection.is_open
+    assert channel.acks == [(2, True)], channel.acks
+    print('acks sent on close ok')
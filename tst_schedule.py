@@ -0,0 +1,76 @@
+import os
+import tempfile
+import timeit
+from datetime import datetime, timedelta
+
+from vcc.schedule import read, ScheduleStore
+
+
+# Parser used by Processor.load before vcc.schedule
+def old_parse(path, sta_id):
+    def decode_scan(line, sources):
+        start, src_name, scan_name, dur, stations = line.split('|')
+        src_name = src_name.split('=')[-1]
+        scan_name = scan_name.split('=')[-1]
+        duration = int(dur.split('=')[-1])
+        stations = stations.lower().split()
+        start = datetime.strptime(start.strip(), '%Y-%m-%d %H:%M:%S')
+        end = start + timedelta(seconds=duration)
+        return start, end, sources[src_name], scan_name, stations
+
+    sources, scans = {}, []
+    with open(path) as file:
+        for line in file:
+            key, info = line.split(':', 1)
+            if key == 'SESSION':
+                datetime.strptime(line.split('|')[1], '%Y-%m-%d %H:%M:%S')
+            elif key == 'SOURCE':
+                code, name, rad, dec, epoch = info[1:10], info[10:19], info[19:35], info[36:55], info[55:62]
+                name = code.strip() if name.startswith('$') else name.strip()
+                rad, dec, epoch = float(rad.replace(' ', '')), float(dec.replace(' ', '')), epoch.strip()
+                sources[name] = f'{name},{rad:.2f},{dec:.2f},{epoch}'
+            elif key == 'SCAN':
+                start, end, src, scan, stations = decode_scan(info, sources)
+                if sta_id in stations:
+                    scans.append((start, end, src, scan))
+    return scans
+
+
+# Make a schedule similar to a 24 hour VGOS session with many stations and short scans
+def make_schedule(path, nbr_stations=20, nbr_sources=300, nbr_scans=40000):
+    start = datetime(2022, 6, 1, 18)
+    stations = [f'S{index:d}'[-2:].lower() for index in range(nbr_stations)]
+    with open(path, 'w') as file:
+        print(f'SESSION:vt2152|{start.strftime("%Y-%m-%d %H:%M:%S")}|vgos', file=file)
+        for index in range(nbr_sources):
+            code = f'{index:04d}+{index % 90:03d}'
+            ra, dec = f'{index % 24:02d} {index % 60:02d} {index % 60:02d}.123456', f'{index % 90:02d} 12 34.56789'
+            print(f'SOURCE: {code:9s}{"$":9s}{ra:>16s} {dec:>19s}{"2000.0":7s}', file=file)
+        for index in range(nbr_scans):
+            utc = (start + timedelta(seconds=2*index)).strftime('%Y-%m-%d %H:%M:%S')
+            source = f'{index % nbr_sources:04d}+{index % nbr_sources % 90:03d}'
+            network = ' '.join(stations[index % 7:index % 7 + 8])
+            print(f'SCAN:{utc}|source={source}|scan=152-{index:05d}|duration=30|{network}', file=file)
+
+
+if __name__ == '__main__':
+    path = os.path.join(tempfile.mkdtemp(), 'vt2152.skd')
+    make_schedule(path)
+    print(f'{path} {os.path.getsize(path) / 1024 / 1024:.1f} MB')
+
+    old, new = old_parse(path, 's3'), read(path, 's3')
+    assert [scan[3] for scan in old] == [scan.name for scan in new.scans]
+    assert [scan[0] for scan in old] == [scan.start for scan in new.scans]
+
+    store = ScheduleStore(os.path.join(os.path.dirname(path), 'schedules.db'))
+    print(f'{"index file":20s} {timeit.timeit(lambda: store.add(path), number=1) * 1000:8.2f} ms')
+    assert store.load(path, 's3') == new
+
+    number = 5
+    for name, fnc in [('old parser', lambda: old_parse(path, 's3')),
+                      ('stream parser', lambda: read(path, 's3')),
+                      ('store scans', lambda: store.read(path, 's3')),
+                      ('store cached scans', lambda: store.load(path, 's3')),
+                      ('store info', lambda: store.info(path))]:
+        dt = timeit.timeit(fnc, number=number) / number
+        print(f'{name:20s} {dt * 1000:8.2f} ms')
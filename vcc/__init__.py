@@ -1,4 +1,5 @@
 from datetime import date, datetime
+import json
 
 
 # Error with VCC problems
@@ -7,15 +8,19 @@ class VCCError(Exception):
         self.err_msg = err_msg
 
 
-# Change dictionary to attribute of a class
-def make_object(data, cls=None):
-    # Change a iso format string to datetime. Return string if not datetime
-    def decode_obj(val):
+# Change a iso format string to datetime. Return value if not a datetime
+def decode_time(val):
+    # Quick check for YYYY-MM-DD before trying to decode
+    if isinstance(val, str) and len(val) >= 10 and val[4] == '-' and val[7] == '-':
         try:
             return datetime.fromisoformat(val)
-        except (ValueError, TypeError):
-            return val
+        except ValueError:
+            pass
+    return val
 
+
+# Change dictionary to attribute of a class
+def make_object(data, cls=None):
     # Use empty Obj class if one is not provided
     cls = cls if cls else type('Obj', (), {})()
 
@@ -24,9 +29,9 @@ def make_object(data, cls=None):
         if isinstance(value, dict):
             setattr(cls, key, make_object(value))
         elif isinstance(value, list):
-            setattr(cls, key, [decode_obj(val) for val in value])
+            setattr(cls, key, [decode_time(val) for val in value])
         else:
-            setattr(cls, key, decode_obj(value))
+            setattr(cls, key, decode_time(value))
     return cls
 
 
@@ -41,13 +46,38 @@ def json_encoder(obj):
     return obj
 
 
-# Decode date and datetime object in string with isoformat
-def json_decoder(obj):
-    try:
-        return datetime.fromisoformat(obj)
-    except:
-        if isinstance(obj, dict):
-            return {name: json_decoder(item) for name, item in obj.items()}
-        if isinstance(obj, list):
-            return [json_decoder(item) for item in obj]
+# Decode date and datetime object in string with isoformat.
+# If fields is provided, only string values of these keys are decoded.
+def json_decoder(obj, fields=None):
+    if isinstance(obj, dict):
+        return {name: decode_time(item) if isinstance(item, str) and (fields is None or name in fields)
+                else json_decoder(item, fields) if isinstance(item, (dict, list)) else item
+                for name, item in obj.items()}
+    if isinstance(obj, list):
+        return [decode_time(item) if isinstance(item, str) and fields is None
+                else json_decoder(item, fields) if isinstance(item, (dict, list)) else item
+                for item in obj]
+    return decode_time(obj) if fields is None else obj
+
+
+# Decode date and datetime in list and nested lists. Dictionaries have already been decoded by json_hook.
+def decode_items(items):
+    return [decode_time(val) if isinstance(val, str) else decode_items(val) if isinstance(val, list) else val
+            for val in items]
+
+
+# Hook for json.loads decoding date and datetime while parsing (ex: rsp.json(object_hook=json_hook))
+# Top level list is not seen by hook. Use json_loads or decode_items(rsp.json(object_hook=json_hook)).
+def json_hook(obj):
+    for name, item in obj.items():
+        if isinstance(item, str):
+            obj[name] = decode_time(item)
+        elif isinstance(item, list):
+            obj[name] = decode_items(item)
     return obj
+
+
+# Decode json text with json_hook, including top level list or string
+def json_loads(text):
+    data = json.loads(text, object_hook=json_hook)
+    return decode_items(data) if isinstance(data, list) else decode_time(data)
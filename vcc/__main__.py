@@ -1,15 +1,21 @@
 
-from vcc import settings, signature, json_decoder, VCCError
+from vcc import settings, signature, json_hook, VCCError
 from vcc.vws import get_client
 from vcc.messaging import RMQclient, RMQclientException
 
 
-def test_messaging(group_id, session=None):
+def test_messaging(group_id, session=None, pings=1):
     print('Test on message communication ', end = '')
     try:
         client = get_client(group_id)
         with RMQclient(client.get_inbox_credentials(session)) as client:
-            print(f'is successful! Delay is {client.alive():.3f} seconds')
+            if pings > 1:
+                stats = client.latency(pings)
+                print(f'is successful! {stats["count"] - stats["lost"]}/{stats["count"]} pings', end=' ')
+                print(' '.join(f'{name}={stats[name]:.3f}' for name in ['min', 'avg', 'max', 'p50', 'p90', 'p99']),
+                      'seconds')
+            else:
+                print(f'is successful! Delay is {client.alive():.3f} seconds')
     except (VCCError, RMQclientException) as exc:
         print(f'fails! {str(exc)}')
 
@@ -25,7 +31,7 @@ def show_session(code):
         rsp = client.get(f'/sessions/{code}')
         if not rsp:
             raise VCCError(rsp.text)
-        data = json_decoder(rsp.json())
+        data = rsp.json(object_hook=json_hook)
         start = data['start']
         db_name = f'{start.strftime("%y%b%d")}{data["db_code"]}'.upper()
         included = f'{"".join(list(map(str.capitalize, data["included"])))}'
@@ -59,6 +65,8 @@ def main():
     parser = argparse.ArgumentParser( description='Schedule Viewer' )
     parser.add_argument('-c', '--config', help='config file', required=True)
     parser.add_argument('-m', '--messaging', help='test messaging system', required=False)
+    parser.add_argument('-p', '--pings', help='number of pings for messaging test', type=int, default=1,
+                        required=False)
     parser.add_argument('-d', '--dashboard', help='get dashboard queue name', required=False)
     parser.add_argument('-s', '--session', help='session code', required=False)
     parser.add_argument('-v', '--validate', help='group', required=False)
@@ -66,7 +74,7 @@ def main():
     args = settings.init(parser.parse_args())
 
     if args.messaging:
-        test_messaging(args.messaging)
+        test_messaging(args.messaging, pings=args.pings)
     elif args.dashboard:
         test_messaging('DB', session=args.dashboard)
     elif args.validate:
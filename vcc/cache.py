@@ -0,0 +1,122 @@
+from collections import namedtuple
+from threading import Lock
+from time import time
+from urllib.parse import urlencode
+import json
+import os
+import sqlite3
+
+from vcc import settings
+
+
+Cached = namedtuple('Cached', ['status', 'headers', 'content', 'stored', 'jwt_data'])
+
+
+# Cache of web service responses stored on local disk
+class ResponseCache:
+    # Headers that are kept with content. Signature token is only valid for the process that received it.
+    keep_headers = ['content-type', 'content-disposition', 'etag', 'last-modified']
+
+    def __init__(self, path, max_size=50, ttl=None):
+        self.max_size = int(max_size * 1024 * 1024)  # Size in MB
+        # Time to live in seconds for each path prefix
+        self.ttl = ttl if ttl else {'/catalog': 86400, '/stations': 86400}
+        self.lock = Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, path TEXT, status INTEGER, '
+                        'headers TEXT, content BLOB, size INTEGER, stored REAL, used REAL)')
+        # Signature data validated when response was received (added to older cache files)
+        if 'jwt' not in [row[1] for row in self.db.execute('PRAGMA table_info(responses)')]:
+            self.db.execute('ALTER TABLE responses ADD COLUMN jwt TEXT')
+        self.db.commit()
+
+    # Make sure path is starting with /
+    @staticmethod
+    def clean_path(path):
+        return '/' + path.lstrip('/')
+
+    # Get longest prefix in ttl table matching path. Return None if path should not be cached
+    def get_prefix(self, path):
+        path = self.clean_path(path)
+        prefixes = [prefix for prefix in self.ttl if path.startswith(prefix)]
+        return max(prefixes, key=len) if prefixes else None
+
+    # Get time to live for a path. Return None if path should not be cached
+    def get_ttl(self, path):
+        prefix = self.get_prefix(path)
+        return self.ttl[prefix] if prefix else None
+
+    # Make unique key for request
+    def make_key(self, group_id, path, params):
+        query = urlencode(sorted((name, value) for name, value in (params or {}).items() if value is not None),
+                          doseq=True)
+        return f'{group_id}:{self.clean_path(path)}?{query}'
+
+    # Get cached response
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute('SELECT status, headers, content, stored, jwt FROM responses WHERE key=?',
+                                  (key,)).fetchone()
+            if not row:
+                return None
+            self.db.execute('UPDATE responses SET used=? WHERE key=?', (time(), key))
+            self.db.commit()
+        return Cached(row[0], json.loads(row[1]), row[2], row[3], json.loads(row[4]) if row[4] else None)
+
+    # Store response with data of its validated signature
+    def put(self, key, path, rsp, jwt_data=None):
+        headers = {name: value for name, value in rsp.headers.items() if name.lower() in self.keep_headers}
+        now = time()
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO responses (key, path, status, headers, content, size, stored, '
+                            'used, jwt) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            (key, self.clean_path(path), rsp.status_code, json.dumps(headers), rsp.content,
+                             len(rsp.content), now, now, json.dumps(jwt_data, default=str) if jwt_data else None))
+            self.evict()
+            self.db.commit()
+
+    # Response has been validated by web service
+    def touch(self, key):
+        now = time()
+        with self.lock:
+            self.db.execute('UPDATE responses SET stored=?, used=? WHERE key=?', (now, now, key))
+            self.db.commit()
+
+    # Remove least recently used responses until size is under max_size
+    def evict(self):
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        for key, size in self.db.execute('SELECT key, size FROM responses ORDER BY used').fetchall():
+            if total <= self.max_size:
+                break
+            self.db.execute('DELETE FROM responses WHERE key=?', (key,))
+            total -= size
+
+    # Remove all responses for path and sub paths
+    def invalidate(self, path):
+        path = self.clean_path(path).rstrip('/')
+        with self.lock:
+            self.db.execute('DELETE FROM responses WHERE path=? OR path LIKE ?', (path, path + '/%'))
+            self.db.commit()
+
+    # Remove all responses
+    def clear(self):
+        with self.lock:
+            self.db.execute('DELETE FROM responses')
+            self.db.commit()
+
+
+_cache, _lock = None, Lock()
+
+
+# Get cache defined in configuration file. Return None if not used.
+def get_cache():
+    global _cache
+
+    with _lock:
+        if _cache is None and hasattr(settings, 'Cache'):
+            config = settings.Cache
+            folder = getattr(config, 'folder', os.path.join(os.path.expanduser('~'), '.vcc'))
+            os.makedirs(folder, exist_ok=True)
+            ttl = config.TTL.__dict__ if hasattr(config, 'TTL') else None
+            _cache = ResponseCache(os.path.join(folder, 'responses.db'), getattr(config, 'size', 50), ttl)
+    return _cache
@@ -1,13 +1,20 @@
+import asyncio
 import functools
+import inspect
+import random
+import threading
 
+from collections import deque
+from contextvars import ContextVar
 from datetime import datetime, date
-from sshtunnel import SSHTunnelForwarder
+from time import perf_counter, time
 from urllib.parse import quote
 
+import aio_pika
 import pika
-import json
 
-from vcc import json_encoder
+from vcc import serializers
+from vcc.tunnel import get_tunnel
 
 
 # Define VLBIexception
@@ -16,14 +23,150 @@ class RMQclientException(Exception):
         self.err_msg = err_msg
 
 
+# Broker has rejected credentials
+class RMQcredentialsException(RMQclientException):
+    pass
+
+
+# Make VLBI message headers and body. Formats decoded by this client are advertised in accept header.
+def make_message(sender, code, data, fmt='json'):
+    fmt, msg = serializers.encode(data, fmt)
+
+    headers = {'type': 'vlbi', 'sender': sender, 'code': code, 'format': fmt, 'utc': datetime.utcnow().isoformat(),
+               'accept': serializers.accepted()}
+    return headers, msg
+
+
+# Decode body of message using format header
+def decode_body(headers, body):
+    return serializers.decode(headers, body)
+
+
+# Message received from broker. Body is decoded and text is rendered only when they are used.
+class Message:
+    __slots__ = ('headers', 'body', '_data', '_text')
+
+    def __init__(self, headers, body):
+        self.headers, self.body = headers, body
+        self._data = self._text = None
+
+    # Code of message
+    @property
+    def code(self):
+        return self.headers.get('code')
+
+    # Sender of message
+    @property
+    def sender(self):
+        return self.headers.get('sender')
+
+    # Data decoded using format header. Body that has already been decoded is used as is.
+    @property
+    def data(self):
+        if self._data is None:
+            is_raw = isinstance(self.body, (bytes, bytearray))
+            self._data = decode_body(self.headers, self.body) if is_raw else self.body
+        return self._data
+
+    # Text summary of data
+    @property
+    def text(self):
+        if self._text is None:
+            data = self.data
+            self._text = ', '.join([f'{key}={val}' for key, val in data.items()]) if isinstance(data, dict) \
+                else str(data)
+        return self._text
+
+    def __str__(self):
+        return f'{self.code} {self.text}'
+
+
+# Route messages to functions registered for their code
+class Dispatcher:
+    def __init__(self, default=None):
+        self.routes, self.default = {}, default
+
+    # Decorator registering function for one or many message codes
+    def route(self, *codes):
+        def register(fnc):
+            for code in codes:
+                self.routes[code] = fnc
+            return fnc
+        return register
+
+    # Register function for a message code
+    def add(self, code, fnc):
+        self.routes[code] = fnc
+
+    # Make routing table with functions registered in class bound to instance
+    def bind(self, instance, default=None):
+        dispatcher = Dispatcher(default if default else self.default)
+        dispatcher.routes = {code: fnc.__get__(instance) for code, fnc in self.routes.items()}
+        return dispatcher
+
+    # Get function for a message code
+    def get(self, code):
+        return self.routes.get(code, self.default)
+
+    # Call function registered for message code with message. Return False if nothing is processing it.
+    def dispatch(self, message):
+        if fnc := self.routes.get(message.code, self.default):
+            fnc(message)
+            return True
+        return False
+
+    __call__ = dispatch
+
+
+# Statistics on round trip times (seconds) of pings
+def latency_stats(times, count):
+    times = sorted(times)
+
+    def percentile(pc):  # Nearest rank
+        return times[max(0, -(-len(times) * pc // 100) - 1)]
+
+    return {'count': count, 'lost': count - len(times), 'min': times[0], 'avg': sum(times) / len(times),
+            'max': times[-1], 'p50': percentile(50), 'p90': percentile(90), 'p99': percentile(99)}
+
+
 # Class to send/receive messages with the message broker of the VCC.
 class RMQclient:
 
-    def __init__(self, config, multi=False):
+    def __init__(self, config, multi=False, confirm=False, batch_size=0, batch_delay=0.1,
+                 prefetch=1, ack_batch=1, ack_delay=0.1, spool=None, reconnect=False, credentials_provider=None,
+                 max_delay=60):
         # Default TTL for important messages
         self.ttl = 5000
         self.max_attempts = 5
 
+        # Broker confirms that messages are delivered (confirms of a batch are waited once)
+        self.confirm, self.pipelined = confirm, False
+        self.delivery_tag, self.unconfirmed, self.rejected = 0, set(), 0
+        # Buffer messages and publish them when batch_size is reached or after batch_delay seconds
+        self.batch_size, self.batch_delay = batch_size, batch_delay
+        self.outbound, self.flush_id = [], None
+        self.multi, self.loop_thread = multi, None
+        # Messages that could not be published are stored in spool and replayed after connect
+        self.spool = spool
+        # Reconnect when connection is lost using jittered exponential backoff (1 second up to max_delay).
+        # Config is reused until broker rejects credentials, then new one is requested from credentials_provider.
+        self.reconnect, self.credentials_provider, self.max_delay = reconnect, credentials_provider, max_delay
+        self.wake_up, self.skip_acks = threading.Event(), 0
+        self.metrics = {'disconnects': 0, 'reconnects': 0, 'attempts': 0, 'credentials_refreshed': 0,
+                        'downtime': 0.0, 'last_error': None, 'last_reconnect': None}
+
+        # Number of messages sent by broker before they are acknowledged
+        self.prefetch = prefetch
+        # Acknowledge messages with one basic_ack when ack_batch is reached or after ack_delay seconds
+        self.ack_batch, self.ack_delay, self.ack_id = ack_batch, ack_delay, None
+        self.unacked, self.pending, self.done = deque(), deque(), set()
+        self.last_ready, self.nbr_ready = None, 0
+        # Messages delivered in batch to process_msg
+        self.inbox, self.inbox_size, self.inbox_delay, self.inbox_id = [], 0, 0.05, None
+
+        # Format used for messages sent to each routing key (learned from accept header of received messages)
+        self.formats = {}
+
         # Initialize some variables
         self.exchange = self.queue = self.tunnel = None
         self._config = config
@@ -49,7 +192,7 @@ class RMQclient:
     # Get config for this client
     @property
     def config(self):
-        return self._config.__dict__
+        return self._config.as_dict() if hasattr(self._config, 'as_dict') else self._config.__dict__
 
     # Make sure communications are close when instance is destroyed
     def __del__(self):
@@ -80,25 +223,31 @@ class RMQclient:
         self.exchange, self.queue = self._config.exchange, self._config.queue
 
         try:
-            if hasattr(self._config, 'tunnel'):
+            if hasattr(self._config, 'tunnel'):  # Use tunnel shared with web service client
                 try:
-                    self.tunnel = SSHTunnelForwarder(url, ssh_username=self._config.tunnel,
-                                                     ssh_pkey=self._config.ssh_pkey,
-                                                     remote_bind_address=('localhost', port)
-                                                     )
-                    self.tunnel.start()
+                    self.tunnel = self.tunnel if self.tunnel else get_tunnel(self._config)
+                    url, port = '127.0.0.1', self.tunnel.local_port(port)
                 except Exception as exc:
                     raise RMQclientException(f'Could not start tunnel {str(exc)}')
-                url, port = '127.0.0.1', self.tunnel.local_bind_port
 
             user, password = self.config.get('credentials')
             credentials = pika.credentials.PlainCredentials(user, password)
             parameters = pika.ConnectionParameters(host=url, port=int(port), credentials=credentials,
                                                    virtual_host=quote(self.config['vhost'], safe=""))
             self.connection = pika.BlockingConnection(parameters)
+        except (pika.exceptions.ProbableAuthenticationError, pika.exceptions.ProbableAccessDeniedError,
+                pika.exceptions.AuthenticationError) as err:
+            self.add_error(f'VCC message broker rejected credentials')
+            raise RMQcredentialsException(f'Could not connect {str(err)}')
         except pika.exceptions.AMQPConnectionError as err:
             self.add_error(f'Could not connect to VCC message broker')
             raise RMQclientException(f'Could not connect {str(err)}')
+        # Publish messages that were stored while disconnected
+        if self.spool and len(self.spool):
+            try:
+                self.replay()
+            except RMQclientException as exc:
+                self.add_error(exc.err_msg)
 
     # Connect a channel
     def connect_channel(self, channel, name):
@@ -109,11 +258,71 @@ class RMQclient:
         except pika.exceptions.AMQPConnectionError as err:
             raise RMQclientException(f'Could not connect to {name} channel {str(err)}')
 
-    # Gracefully stop a connection
+    # Connect publishing channel. In confirm mode, confirmations are received by on_confirm so that messages are
+    # published without waiting for each one (blocking channel confirm_delivery waits after every message).
+    # This uses the channel and connection internals of pika 1.2 (version pinned in requirements.txt).
+    # Other versions use the public confirm_delivery and messages are confirmed one by one.
+    def connect_publishing(self):
+        if self.publishing and self.publishing.is_open:
+            return self.publishing
+        channel = self.connect_channel(None, 'publishing')
+        if self.confirm:
+            self.delivery_tag, self.unconfirmed, self.rejected = 0, set(), 0
+            self.pipelined = pika.__version__.startswith('1.2.') and hasattr(channel, '_impl') \
+                and hasattr(self.connection, '_flush_output')
+            try:
+                if not self.pipelined:
+                    channel.confirm_delivery()
+                    return channel
+                selected = []
+                channel._impl.confirm_delivery(ack_nack_callback=self.on_confirm, callback=selected.append)
+                self.connection._flush_output(lambda: selected or channel.is_closed)
+            except pika.exceptions.AMQPError as err:
+                raise RMQclientException(f'Could not set publishing channel mode {str(err)}')
+            if not selected:
+                raise RMQclientException('Could not set publishing channel in confirm mode')
+        return channel
+
+    # Broker has confirmed (ack) or rejected (nack) one or many messages
+    def on_confirm(self, frame):
+        tag, multiple = frame.method.delivery_tag, frame.method.multiple
+        confirmed = {item for item in self.unconfirmed if item <= tag} if multiple else {tag} & self.unconfirmed
+        self.unconfirmed -= confirmed
+        if isinstance(frame.method, pika.spec.Basic.Nack):
+            self.rejected += len(confirmed)
+
+    # Publish messages in order. In confirm mode, confirmations of all messages are waited once.
+    # Return number of leading messages that have been published (and confirmed) and error message if any.
+    def publish(self, messages):
+        tags, error = [], None
+        try:
+            self.publishing = self.connect_publishing()
+            for (exchange, key, msg, properties) in messages:
+                try:
+                    self.publishing.basic_publish(exchange, key, msg, pika.BasicProperties(**properties))
+                except pika.exceptions.NackError:  # Confirmed one by one
+                    self.rejected += 1
+                if self.confirm and self.pipelined:
+                    self.delivery_tag += 1
+                    self.unconfirmed.add(self.delivery_tag)
+                tags.append(self.delivery_tag)
+            if self.confirm and self.pipelined:
+                self.connection._flush_output(lambda: not self.unconfirmed or self.publishing.is_closed)
+        except (pika.exceptions.AMQPError, RMQclientException) as err:
+            error = err.err_msg if isinstance(err, RMQclientException) else str(err)
+        done = next((index for index, tag in enumerate(tags) if tag in self.unconfirmed), len(tags))
+        if done < len(messages):
+            return done, error if error else 'publishing channel closed before confirmation'
+        if self.rejected:  # Publishing them again will not help
+            rejected, self.rejected = self.rejected, 0
+            return done, f'{rejected} messages rejected by broker'
+        return done, None
+
+    # Release tunnel shared with other clients
     @staticmethod
-    def stop_it(item):
+    def release_it(item):
         try:
-            item.stop()
+            item.release()
         finally:
             return None
 
@@ -124,59 +333,174 @@ class RMQclient:
         finally:
             return None
 
-    # Close all connection
-    def close(self):
+    # Close all connection. Connection used by monit is closed by the thread processing its events.
+    def close(self, timeout=5):
         self.close_requested = True
+        self.wake_up.set()  # Stop waiting for reconnect
+        if self.connection and self.loop_thread and threading.get_ident() != self.loop_thread:
+            done = threading.Event()
+
+            def shutdown_it():
+                try:
+                    self.shutdown()
+                finally:
+                    done.set()
+
+            try:
+                self.connection.add_callback_threadsafe(shutdown_it)
+                done.wait(timeout)
+            except (pika.exceptions.AMQPError, AttributeError):  # Connection is already closed
+                pass
+            if not done.is_set() and self.loop_thread:
+                self.add_error('Could not close connection')
+                return
+        self.shutdown()
+        # Release tunnel
+        self.tunnel = self.release_it(self.tunnel) if self.tunnel else None
+
+    # Publish buffered messages, acknowledge processed messages and close connection
+    def shutdown(self):
+        try:
+            if self.outbound and self.connection:
+                self._flush()
+        except RMQclientException as exc:
+            self.add_error(f'Messages lost while closing {str(exc)}')
+        if self.consuming and self.consuming.is_open:
+            self._flush_acks()
+            try:
+                self.consuming.stop_consuming()
+            except Exception:
+                pass
         # Close all connections
         [self.close_it(item) for item in [self.publishing, self.consuming, self.connection] if item]
         self.publishing = self.consuming = self.connection = None
-        # Stop tunnel
-        self.tunnel = self.stop_it(self.tunnel) if self.tunnel else None
 
     # Thread safe function to send message
     def send(self, sender, code, key, data, reply_to='', priority=0, ttl=None, to_queue=False):
-        cb = functools.partial(self._send, sender, code, key, data, reply_to, priority, ttl, to_queue)
-        self.connection.add_callback_threadsafe(cb)
-
-    # Publish messages
-    def _send(self, sender, code, key, data, reply_to='', priority=0, ttl=None, to_queue=False):
-        self.publishing = self.connect_channel(self.publishing, 'publishing')
-        # Detect format message
-        fmt, msg = ('text', data) if isinstance(data, str) else ('json', json.dumps(data, default=json_encoder))
-
-        headers = {'type': 'vlbi', 'sender': sender, 'code': code, 'format': fmt, 'utc': datetime.utcnow().isoformat()}
+        cb = functools.partial(self.call_safe, self._send, sender, code, key, data, reply_to, priority, ttl, to_queue)
+        try:
+            self.connection.add_callback_threadsafe(cb)
+        except (pika.exceptions.AMQPError, AttributeError) as err:  # Connection is closed or not created
+            if not self.spool:
+                raise RMQclientException(f'Could not send message {str(err)}')
+            self.spool.put([self.make_outbound(sender, code, key, data, reply_to, priority, ttl, to_queue)])
+
+    # Make message ready to be published (exchange, routing key, body, properties)
+    def make_outbound(self, sender, code, key, data, reply_to='', priority=0, ttl=None, to_queue=False):
+        headers, msg = make_message(sender, code, data, self.get_format(key))
         properties = {'delivery_mode': 2, 'priority': priority, 'reply_to': reply_to, 'headers': headers,
                       'expiration': str(ttl) if ttl else None}
+        return '' if to_queue else self.exchange, key, msg, properties
 
+    # Publish messages
+    def _send(self, sender, code, key, data, reply_to='', priority=0, ttl=None, to_queue=False):
+        self.outbound.append(self.make_outbound(sender, code, key, data, reply_to, priority, ttl, to_queue))
+        if self.spool and not (self.connection and self.connection.is_open):  # Keep it until reconnected
+            self.spool.put(self.outbound)
+            self.outbound = []
+        elif len(self.outbound) >= self.batch_size:
+            self._flush()
+        elif not self.flush_id:  # Publish burst of messages after batch_delay
+            self.flush_id = self.connection.call_later(self.batch_delay, functools.partial(self.call_safe, self._flush))
+
+    # Call function from connection events. Errors are reported instead of stopping the consumer loop.
+    # Messages that could not be published are kept in spool or outbound buffer by _flush.
+    def call_safe(self, fnc, *args):
         try:
-            exchange = '' if to_queue else self.exchange
-            self.publishing.basic_publish(exchange, key, msg, pika.BasicProperties(**properties))
-        except pika.exceptions.ChannelWrongStateError as err:
-            raise RMQclientException(f'Publisher channel error{str(err)}')
-
-    # Test that queue is alive
+            fnc(*args)
+        except RMQclientException as exc:
+            self.add_error(exc.err_msg)
+
+    # Publish all buffered messages
+    def _flush(self):
+        if self.flush_id:
+            self.connection.remove_timeout(self.flush_id)
+            self.flush_id = None
+        if not self.outbound:
+            return
+        messages, self.outbound = self.outbound, []
+        try:
+            if self.spool and len(self.spool):  # Older messages are published first
+                self.replay()
+            done, error = self.publish(messages)
+        except RMQclientException as err:
+            done, error = 0, err.err_msg
+        if not error:
+            return
+        if not (remaining := messages[done:]):  # Rejected by broker
+            raise RMQclientException(f'Messages not confirmed by broker {error}')
+        if self.spool:  # Keep messages that have not been published on disk until connection is back
+            self.spool.put(remaining)
+            self.add_error(f'{len(remaining)} messages spooled {error}')
+            return
+        self.outbound = remaining + self.outbound  # Keep messages for next flush
+        raise RMQclientException(f'Publisher channel error {error}')
+
+    # Publish messages stored in spool in the order they have been sent
+    def replay(self):
+        while messages := self.spool.get():
+            done, error = self.publish([(msg.exchange, msg.key, msg.body, msg.properties) for msg in messages])
+            if done:  # Do not publish them twice. Messages rejected by broker are also removed.
+                self.spool.remove(messages[done - 1].id)
+            if error:
+                raise RMQclientException(f'Could not replay spooled messages {error}')
+
+    # Publish all buffered messages. Wait until it is done if called from another thread.
+    def flush(self, timeout=None):
+        if not self.multi or not self.loop_thread or threading.get_ident() == self.loop_thread:
+            return self._flush()
+        done, errors = threading.Event(), []
+
+        def flush_it():
+            try:
+                self._flush()
+            except RMQclientException as exc:
+                errors.append(exc)
+            finally:
+                done.set()
+
+        self.connection.add_callback_threadsafe(flush_it)
+        if not done.wait(timeout):
+            raise RMQclientException('Flush did not complete')
+        if errors:
+            raise errors[0]
+
+    # Test that queue is alive. Return round trip time in seconds.
     def alive(self):
-        # Ping same queue and read message
-        self.ping(self.queue, to_queue=True)
+        return self.latency(1)['max']
 
-        # Check is message is coming back (wait maximum time == self.ttl)
-        self.consuming = self.connect_channel(self.consuming, 'consumer')
-        start = datetime.now()
-        try:
-            while (datetime.now() - start).total_seconds() * 1000 < self.ttl:
-                method, props, body = self.consuming.basic_get(self.queue)
-                if method:
-                    now = datetime.utcnow()
-                    if props.headers.get('code', '') == 'ping':
-                        dt = now - datetime.fromisoformat(props.headers['utc'])
-                        self.consuming.basic_ack(method.delivery_tag)  # ACK message
-                        return dt.total_seconds()
-                    else: # Not the right message
-                        self.consuming.basic_reject(method.delivery_tag)
-        except (pika.exceptions.ConnectionClosedByBroker, pika.exceptions.ConnectionClosed,
-                pika.exceptions.AMQPError, Exception) as err:
-            raise RMQclientException(f'Test alive failed{str(err)}')
-        raise RMQclientException(f'No answer after {int(self.ttl/1000)} seconds')
+    # Measure round trip time of count pings sent to a temporary queue.
+    # Replies are matched with correlation ids and received by a consumer (no polling of the inbox)
+    def latency(self, count=10):
+        channel = self.connect_channel(None, 'probe')
+        sent, times = {}, []
+
+        def on_reply(ch, method, properties, body):
+            if (start := sent.pop(properties.correlation_id, None)) is not None:
+                times.append(perf_counter() - start)
+
+        try:
+            channel.queue_declare(self.queue, passive=True)  # Fail if inbox does not exist
+            name = channel.queue_declare('', exclusive=True, auto_delete=True).method.queue
+            channel.basic_consume(queue=name, on_message_callback=on_reply, auto_ack=True)
+            headers, msg = make_message(self.queue, 'ping', 'request status')
+            for index in range(count):
+                correlation_id = f'{id(self):x}-{index}'
+                properties = pika.BasicProperties(delivery_mode=1, priority=5, headers=headers,
+                                                  expiration=str(self.ttl), correlation_id=correlation_id)
+                sent[correlation_id] = perf_counter()
+                channel.basic_publish('', name, msg, properties)
+                # Wait for reply (maximum time == self.ttl)
+                deadline = sent[correlation_id] + self.ttl / 1000
+                while correlation_id in sent and (remaining := deadline - perf_counter()) > 0:
+                    self.connection.process_data_events(time_limit=remaining)
+        except pika.exceptions.AMQPError as err:
+            raise RMQclientException(f'Test alive failed {str(err)}')
+        finally:
+            self.close_it(channel)
+        if not times:
+            raise RMQclientException(f'No answer after {int(self.ttl/1000)} seconds')
+        return latency_stats(times, count)
 
     # Send a ping to specific target
     def ping(self, target, to_queue=False, need_reply=False):
@@ -189,35 +513,151 @@ class RMQclient:
 
     # Generic function doing nothing with message
     def do_nothing(self, properties, body):
-        self.accept_last_msg()
+        self.acknowledge_msg()
 
     # Connect to queue and wait for message
-    def monit(self, process_fnc, timeout_fnc=None, timeout=300):
+    # Connect to queue and wait for message.
+    # If batch_size > 0, process_fnc receives a list of (headers, body) instead of one message.
+    # If reconnect is set, connection is restored and consumer subscribed again when connection is lost.
+    def monit(self, process_fnc, timeout_fnc=None, timeout=300, batch_size=0, batch_delay=0.05):
         self.process_msg, self.process_timeout, self.timeout = process_fnc, timeout_fnc, timeout
-        self.consuming = self.connect_channel(self.consuming, 'consumer')
+        self.inbox_size, self.inbox_delay = batch_size, batch_delay
+        self.loop_thread = threading.get_ident()  # Thread processing connection events
+        self.unacked.clear(), self.pending.clear(), self.done.clear()
+        self.last_ready, self.nbr_ready, self.skip_acks = None, 0, 0
 
         try:
-            if self.process_timeout:
-                self.timeout_id = self.connection.call_later(self.timeout, self.on_timeout)
-            self.consuming.basic_qos(prefetch_count=1)
-            self.consuming.basic_consume(queue=self.queue, on_message_callback=self.new_msg, auto_ack=False)
-            self.consuming.start_consuming()
-        except (pika.exceptions.ConnectionClosedByBroker, pika.exceptions.ConnectionClosed,
-                pika.exceptions.AMQPError, Exception) as err:
+            self.keep_consuming()
+        finally:
+            self.loop_thread = None  # Connection events are not processed anymore
+
+    # Consume messages until close is requested
+    def keep_consuming(self):
+        while True:
+            try:
+                self.consume()
+                return
+            except (pika.exceptions.AMQPConnectionError, pika.exceptions.ConnectionClosed,
+                    pika.exceptions.ChannelClosed, RMQclientException) as err:
+                error = err.err_msg if isinstance(err, RMQclientException) else str(err)
+                if self.close_requested:
+                    return
+                self.add_error(error)
+                if not self.reconnect:
+                    raise RMQclientException(f'Monit connection lost {error}')
+                self.restore(error)
+                if self.close_requested:
+                    return
+            except Exception as err:
+                if self.close_requested:
+                    return
+                self.add_error(str(err))
+                raise RMQclientException(f'Monit connection lost {str(err)}')
+
+    # Subscribe consumer to queue and process events until connection is closed
+    def consume(self):
+        self.consuming = self.connect_channel(self.consuming, 'consumer')
+        if self.process_timeout:
+            self.timeout_id = self.connection.call_later(self.timeout, self.on_timeout)
+        self.consuming.basic_qos(prefetch_count=max(self.prefetch, self.inbox_size))
+        self.consuming.basic_consume(queue=self.queue, on_message_callback=self.new_msg, auto_ack=False)
+        self.consuming.start_consuming()
+
+    # Reconnect using jittered exponential backoff so that all clients are not reconnecting at the same time
+    def restore(self, error):
+        self.metrics['disconnects'] += 1
+        self.metrics['last_error'] = error
+        self.reset_state()
+        start = time()
+        attempt = 0
+        while not self.close_requested:
+            self.wake_up.wait(random.uniform(0, min(self.max_delay, 2 ** attempt)))
             if self.close_requested:
                 return
-            self.add_error(str(err))
-            raise RMQclientException(f'Monit connection lost {str(err)}')
+            attempt += 1
+            self.metrics['attempts'] += 1
+            try:
+                self.connect()
+                self.metrics['reconnects'] += 1
+                self.metrics['downtime'] += time() - start
+                self.metrics['last_reconnect'] = datetime.utcnow()
+                try:  # Publish messages buffered while disconnected
+                    self.flush()
+                except RMQclientException as exc:
+                    self.add_error(exc.err_msg)
+                return
+            except RMQcredentialsException as exc:
+                self.metrics['last_error'] = exc.err_msg
+                if self.credentials_provider:  # Get new credentials and try again
+                    try:
+                        self._config = self.credentials_provider()
+                        self.metrics['credentials_refreshed'] += 1
+                    except Exception as err:
+                        self.add_error(f'Could not get new credentials {str(err)}')
+            except RMQclientException as exc:
+                self.metrics['last_error'] = exc.err_msg
+
+    # Reset state linked to lost connection. Messages not acknowledged will be delivered again by broker.
+    def reset_state(self):
+        if self.consuming and self.consuming.is_open:  # Acknowledge messages already processed
+            self._flush_acks()
+        # Messages given to process_msg cannot be acknowledged on new channel. Ignore their acknowledgements.
+        self.skip_acks += len(self.pending) - len(self.inbox)
+        self.unacked.clear(), self.pending.clear(), self.done.clear()
+        [self.close_it(item) for item in [self.publishing, self.consuming, self.connection] if item]
+        self.publishing = self.consuming = self.connection = None
+        self.timeout_id = self.flush_id = self.ack_id = self.inbox_id = None
+        self.inbox, self.last_ready, self.nbr_ready = [], None, 0
 
     def new_msg(self, ch, method, properties, body):
         self._last_msg = (ch, method)
+        self.unacked.append(method.delivery_tag)
         if properties.headers.get('type', 'unknown') == 'vlbi':  # Valid VLBI message
+            self.learn_format(properties.headers, properties.reply_to)
             if self.process_timeout:
                 self.connection.remove_timeout(self.timeout_id)
                 self.timeout_id = self.connection.call_later(self.timeout, self.on_timeout)
-            self.process_msg(properties.headers, body)
+            self.pending.append(method.delivery_tag)
+            if self.inbox_size > 0:
+                self.add_to_inbox(properties.headers, body)
+            else:
+                self.process_msg(properties.headers, body)
         else:
-            self.acknowledge_msg()
+            self._ack_msg(method.delivery_tag)
+
+    # Set format of messages sent to a routing key
+    def set_format(self, key, fmt):
+        self.formats[key.lower()] = fmt
+
+    # Format of messages sent to a routing key
+    def get_format(self, key):
+        return self.formats.get(key.lower(), 'json') if key else 'json'
+
+    # Use best format accepted by sender of message. Old senders do not have accept header.
+    # Replies to this sender are routed using its name or its reply_to queue.
+    def learn_format(self, headers, reply_to=None):
+        if 'accept' in headers:
+            fmt = serializers.choose(headers['accept'])
+            for key in (headers.get('sender'), reply_to):
+                if key:
+                    self.set_format(key, fmt)
+
+    # Keep message in inbox and deliver inbox when full or after inbox_delay
+    def add_to_inbox(self, headers, body):
+        self.inbox.append((headers, body))
+        if len(self.inbox) >= self.inbox_size:
+            self.deliver_inbox()
+        elif not self.inbox_id:
+            self.inbox_id = self.connection.call_later(self.inbox_delay, self.deliver_inbox)
+
+    # Send all messages in inbox to process_msg
+    def deliver_inbox(self):
+        if self.inbox_id:
+            self.connection.remove_timeout(self.inbox_id)
+            self.inbox_id = None
+        if self.inbox:
+            messages, self.inbox = self.inbox, []
+            self.process_msg(messages)
 
     def on_timeout(self):
         try:
@@ -226,16 +666,275 @@ class RMQclient:
         except Exception as e:
             self.warning(f'ON TIMEOUT {str(e)}')
 
-    # Internal function to ack message (thread safe)
-    def _ack_msg(self, ch, method):
+    # Internal function to ack message. Broker is acknowledged when all previous messages are done.
+    def _ack_msg(self, tag):
+        self.done.add(tag)
+        while self.unacked and self.unacked[0] in self.done:
+            self.last_ready = self.unacked.popleft()
+            self.done.discard(self.last_ready)
+            self.nbr_ready += 1
+        if self.nbr_ready >= self.ack_batch:
+            self._flush_acks()
+        elif self.nbr_ready and not self.ack_id:
+            self.ack_id = self.connection.call_later(self.ack_delay, self._flush_acks)
+
+    # Acknowledge all ready messages with one call
+    def _flush_acks(self):
+        if self.ack_id:
+            self.connection.remove_timeout(self.ack_id)
+            self.ack_id = None
+        if self.last_ready is None:
+            return
         try:
-            ch.basic_ack(method.delivery_tag)
+            self.consuming.basic_ack(self.last_ready, multiple=True)
         except Exception as ex:
-            self.add_error('Could not ACK last message', str(ex))
+            self.add_error(f'Could not ACK messages {str(ex)}')
+        self.last_ready, self.nbr_ready = None, 0
+
+    # Acknowledge next messages in the order they have been delivered (thread safe)
+    def _ack_next(self, count):
+        for _ in range(count):
+            if self.skip_acks:  # Message was delivered before connection was lost
+                self.skip_acks -= 1
+            elif self.pending:
+                self._ack_msg(self.pending.popleft())
+
+    # Accept oldest processed message (or count messages when processed in batch)
+    def acknowledge_msg(self, count=1):
+        cb = functools.partial(self._ack_next, count)
+        try:
+            self.connection.add_callback_threadsafe(cb)
+        except (pika.exceptions.AMQPError, AttributeError):  # Connection lost. Message will be delivered again.
+            self.skip_acks = max(0, self.skip_acks - count)
+
 
-    # Accept last
-    def acknowledge_msg(self):
-        ch, method = self._last_msg
-        cb = functools.partial(self._ack_msg, ch, method)
-        self.connection.add_callback_threadsafe(cb)
+# Class to send/receive messages with the message broker of the VCC using asyncio.
+# Many queues can be monitored and messages published concurrently from one thread.
+class AsyncRMQclient:
 
+    def __init__(self, config, confirm=False, prefetch=1):
+        # Default TTL for important messages
+        self.ttl = 5000
+
+        # Broker confirms that messages are delivered (concurrent sends are confirmed in pipeline)
+        self.confirm, self.prefetch = confirm, prefetch
+
+        # Format used for messages sent to each routing key (learned from accept header of received messages)
+        self.formats = {}
+
+        # Initialize some variables
+        self.exchange = self.queue = self.tunnel = None
+        self._config = config
+
+        self.connection, self.publishing, self._exchange = None, None, None
+        # Messages not acknowledged by each consumer channel in the order of delivery
+        self.consumers, self.pending = [], {}
+        self._consumer = ContextVar(f'consumer_{id(self)}', default=None)  # Channel of monit running this task
+        self._errors = []
+        self.close_requested = False
+
+    # Implement __aenter__
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    # Implement __aexit__ needed by __aenter__
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    # Get config for this client
+    @property
+    def config(self):
+        return self._config.as_dict() if hasattr(self._config, 'as_dict') else self._config.__dict__
+
+    # Add error message to list
+    def add_error(self, string):
+        self._errors.append(string)
+
+    # Check if any error message
+    @property
+    def has_error(self):
+        return bool(self._errors)
+
+    # Return the list of errors as string
+    @property
+    def errors(self):
+        return '\n'.join(self._errors)
+
+    # Connect to broker
+    async def connect(self):
+        self.connection, self.publishing, self._exchange = None, None, None
+        url, port = self._config.url, self._config.msg_port
+        self.exchange, self.queue = self._config.exchange, self._config.queue
+        self.close_requested = False
+
+        if hasattr(self._config, 'tunnel'):  # Use tunnel shared with web service client
+            try:  # Starting ssh transport is blocking
+                loop = asyncio.get_running_loop()
+                self.tunnel = self.tunnel if self.tunnel else get_tunnel(self._config)
+                url, port = '127.0.0.1', await loop.run_in_executor(None, self.tunnel.local_port, port)
+            except Exception as exc:
+                raise RMQclientException(f'Could not start tunnel {str(exc)}')
+
+        user, password = self.config.get('credentials')
+        try:
+            self.connection = await aio_pika.connect(host=url, port=int(port), login=user, password=password,
+                                                     virtualhost=self.config['vhost'])
+        except (aio_pika.exceptions.AMQPError, ConnectionError, OSError) as err:
+            self.add_error(f'Could not connect to VCC message broker')
+            raise RMQclientException(f'Could not connect {str(err)}')
+
+    # Open a channel
+    async def open_channel(self, name, **kwargs):
+        try:
+            return await self.connection.channel(**kwargs)
+        except (aio_pika.exceptions.AMQPError, AttributeError) as err:
+            raise RMQclientException(f'Could not connect to {name} channel {str(err)}')
+
+    # Get publishing channel and exchange
+    async def get_publishing(self, to_queue):
+        if not self.publishing or self.publishing.is_closed:
+            self.publishing = await self.open_channel('publishing', publisher_confirms=self.confirm)
+            self._exchange = None
+        if to_queue:
+            return self.publishing.default_exchange
+        if not self._exchange:
+            self._exchange = await self.publishing.get_exchange(self.exchange, ensure=False)
+        return self._exchange
+
+    # Close all connection
+    async def close(self):
+        self.close_requested = True
+        for item in [*self.consumers, self.publishing, self.connection]:
+            try:
+                if item and not item.is_closed:
+                    await item.close()
+            except Exception:
+                pass
+        self.consumers, self.publishing, self.connection, self._exchange = [], None, None, None
+        self.pending.clear()
+        # Release tunnel
+        self.tunnel = RMQclient.release_it(self.tunnel) if self.tunnel else None
+
+    # Publish message. Many sends can be awaited concurrently.
+    async def send(self, sender, code, key, data, reply_to='', priority=0, ttl=None, to_queue=False):
+        headers, msg = make_message(sender, code, data, self.get_format(key))
+        message = aio_pika.Message(msg.encode('utf-8') if isinstance(msg, str) else msg, headers=headers, priority=priority,
+                                   delivery_mode=aio_pika.DeliveryMode.PERSISTENT, reply_to=reply_to or None,
+                                   expiration=ttl / 1000 if ttl else None)
+        try:
+            exchange = await self.get_publishing(to_queue)
+            await exchange.publish(message, routing_key=key)
+        except aio_pika.exceptions.DeliveryError as err:
+            raise RMQclientException(f'Message not confirmed by broker {str(err)}')
+        except aio_pika.exceptions.AMQPError as err:
+            raise RMQclientException(f'Publisher channel error {str(err)}')
+
+    # Test that queue exists and broker is answering. Return round trip time in seconds.
+    async def alive(self):
+        channel = await self.open_channel('consumer')
+        try:
+            await channel.declare_queue(self.queue, passive=True)  # Fail if inbox does not exist
+            # Ping temporary queue and wait for message (maximum time == self.ttl)
+            queue = await channel.declare_queue(exclusive=True, auto_delete=True)
+            start = datetime.utcnow()
+            await self.ping(queue.name, to_queue=True)
+            async with queue.iterator() as messages:
+                message = await asyncio.wait_for(messages.__anext__(), self.ttl / 1000)
+                await message.ack()
+                return (datetime.utcnow() - start).total_seconds()
+        except asyncio.TimeoutError:
+            raise RMQclientException(f'No answer after {int(self.ttl/1000)} seconds')
+        except aio_pika.exceptions.AMQPError as err:
+            raise RMQclientException(f'Test alive failed {str(err)}')
+        finally:
+            await channel.close()
+
+    # Send a ping to specific target
+    async def ping(self, target, to_queue=False, need_reply=False):
+        return await self.send(self.queue, 'ping', target, 'request status', priority=5, ttl=self.ttl,
+                               to_queue=to_queue, reply_to=self.queue if need_reply else '')
+
+    # Reply to ping
+    async def pong(self, sender, target, status):
+        return await self.send(sender, 'pong', target, {'status': status}, priority=5, ttl=self.ttl, to_queue=True)
+
+    # Generic function doing nothing with message
+    async def do_nothing(self, headers, body):
+        await self.acknowledge_msg()
+
+    # Call function and wait for result if it is a coroutine
+    @staticmethod
+    async def call(fnc, *args):
+        result = fnc(*args)
+        if inspect.isawaitable(result):
+            await result
+
+    # Connect to queue (default is inbox) and wait for message. Many monit can run concurrently.
+    async def monit(self, process_fnc=None, timeout_fnc=None, timeout=300, queue=None):
+        process_fnc = process_fnc if process_fnc else self.do_nothing
+        channel = await self.open_channel('consumer')
+        self.consumers.append(channel)
+        self.pending[channel] = pending = deque()
+        self._consumer.set(channel)
+        try:
+            await channel.set_qos(prefetch_count=self.prefetch)
+            queue = await channel.get_queue(queue if queue else self.queue, ensure=False)
+            async with queue.iterator() as messages:
+                while not self.close_requested:
+                    try:
+                        message = await asyncio.wait_for(messages.__anext__(), timeout if timeout_fnc else None)
+                    except asyncio.TimeoutError:
+                        await self.call(timeout_fnc)
+                        continue
+                    except StopAsyncIteration:
+                        break
+                    if (message.headers or {}).get('type', 'unknown') == 'vlbi':  # Valid VLBI message
+                        self.learn_format(message.headers, message.reply_to)
+                        pending.append(message)
+                        await self.call(process_fnc, message.headers, message.body)
+                    else:
+                        await message.ack()
+        except (aio_pika.exceptions.AMQPError, ConnectionError) as err:
+            if self.close_requested:
+                return
+            self.add_error(str(err))
+            raise RMQclientException(f'Monit connection lost {str(err)}')
+        finally:
+            if channel in self.consumers:
+                self.consumers.remove(channel)
+            self.pending.pop(channel, None)
+
+    # Set format of messages sent to a routing key
+    def set_format(self, key, fmt):
+        self.formats[key.lower()] = fmt
+
+    # Format of messages sent to a routing key
+    def get_format(self, key):
+        return self.formats.get(key.lower(), 'json') if key else 'json'
+
+    # Use best format accepted by sender of message. Old senders do not have accept header.
+    # Replies to this sender are routed using its name or its reply_to queue.
+    def learn_format(self, headers, reply_to=None):
+        if 'accept' in headers:
+            fmt = serializers.choose(headers['accept'])
+            for key in (headers.get('sender'), reply_to):
+                if key:
+                    self.set_format(key, fmt)
+
+    # Accept message or oldest messages processed by the consumer calling this function.
+    # Last of many messages is acknowledged with multiple flag since they are all on the same channel.
+    async def acknowledge_msg(self, count=1, message=None):
+        try:
+            if message:
+                for pending in self.pending.values():
+                    if message in pending:
+                        pending.remove(message)
+                        break
+                await message.ack()
+            elif pending := self.pending.get(self._consumer.get()):
+                for _ in range(min(count, len(pending))):
+                    message = pending.popleft()
+                await message.ack(multiple=count > 1)
+        except Exception as ex:
+            self.add_error(f'Could not ACK messages {str(ex)}')
@@ -0,0 +1,74 @@
+from vcc import make_object, decode_time
+
+
+# Base class for objects decoded from VCC json. Keys that are not declared in __slots__ are kept in _extra.
+class Model:
+    __slots__ = ('_extra',)
+    _fields = frozenset()
+
+    # Keep list of declared fields for fast lookup
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._fields = frozenset(name for klass in cls.__mro__ for name in getattr(klass, '__slots__', ())
+                                if not name.startswith('_'))
+
+    def __init__(self, data=None):
+        self._extra = {}
+        if data:
+            self.update(data)
+
+    # Set attributes with values in data. Nested dictionaries use generic object.
+    def update(self, data):
+        fields, extra, set_field = self._fields, self._extra, object.__setattr__
+        for key, value in data.items():
+            if isinstance(value, dict):
+                value = make_object(value)
+            elif isinstance(value, list):
+                value = [decode_time(val) for val in value]
+            else:
+                value = decode_time(value)
+            if key in fields:
+                set_field(self, key, value)
+            else:
+                extra[key] = value
+        return self
+
+    # Called only when attribute is not a declared field
+    def __getattr__(self, name):
+        try:
+            return object.__getattribute__(self, '_extra')[name]
+        except KeyError:
+            raise AttributeError(f'{self.__class__.__name__} has no attribute {name}')
+
+    # Set attribute. Not declared names are kept in _extra
+    def __setattr__(self, name, value):
+        if name in self._fields or name == '_extra':
+            object.__setattr__(self, name, value)
+        else:
+            self._extra[name] = value
+
+    # Return all attributes that have been set as dictionary
+    def as_dict(self):
+        data = {name: getattr(self, name) for name in self._fields if hasattr(self, name)}
+        return dict(**data, **self._extra)
+
+
+# Schedule summary (/schedules/{ses_id}?select=summary)
+class Schedule(Model):
+    __slots__ = ('version', 'updated', 'observing', 'scheduled')
+
+
+# Station information (/stations)
+class Station(Model):
+    __slots__ = ('code', 'name', 'domes', 'cdp', 'description', 'is_vlba', 'updated')
+
+
+# SEFD record from onoff data (/data/onoff/{sta_id})
+class SEFD(Model):
+    __slots__ = ('sta_id', 'source', 'azimuth', 'elevation', 'observed', 'detectors')
+
+
+# Credentials to access inbox. VCC config combined with information in signature (/users/inbox)
+class Credentials(Model):
+    __slots__ = ('url', 'protocol', 'api_port', 'msg_port', 'tunnel', 'ssh_pkey',
+                 'credentials', 'vhost', 'exchange', 'queue')
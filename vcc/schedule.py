@@ -0,0 +1,208 @@
+from collections import namedtuple, OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+import os
+import re
+import sqlite3
+
+from vcc import settings
+
+
+Scan = namedtuple('Scan', ['index', 'start', 'end', 'source', 'name', 'duration', 'stations'])
+Parsed = namedtuple('Parsed', ['session', 'start', 'end', 'version', 'sources', 'scans'])
+Info = namedtuple('Info', ['session', 'start', 'end', 'version'])
+
+# SCAN:YYYY-mm-dd HH:MM:SS|source=name|scan=name|duration=seconds|stations
+_scan = re.compile(r'SCAN:\s*(\d{4}-\d\d-\d\d \d\d:\d\d:\d\d)\s*\|(?:[^|]*=)?([^|=]*)\|(?:[^|]*=)?([^|=]*)\|'
+                   r'(?:[^|]*=)?\s*(\d+)\s*\|(.*)').match
+
+
+# Decode 'YYYY-mm-dd HH:MM:SS' without strptime
+def decode_time(text):
+    return datetime.fromisoformat(text)
+
+
+# Decode SOURCE line with fixed columns. Return name and text used by station messages
+def decode_source(info):
+    code, name, rad, dec, epoch = info[1:10], info[10:19], info[19:35], info[36:55], info[55:62]
+    name = code.strip() if name.startswith('$') else name.strip()
+    rad, dec, epoch = float(rad.replace(' ', '')), float(dec.replace(' ', '')), epoch.strip()
+    return name, f'{name},{rad:.2f},{dec:.2f},{epoch}'
+
+
+# Read schedule file and yield records as they are read.
+# Records are ('session', code, start, version), ('source', name, text) and ('scan', Scan) with index 0.
+def stream(path):
+    with open(path) as file:
+        for line in file:
+            if line.startswith('SCAN:'):
+                if found := _scan(line):
+                    start, source, name, duration, stations = found.groups()
+                    start, duration = decode_time(start), int(duration)
+                    yield 'scan', Scan(0, start, start + timedelta(seconds=duration), source.strip(), name.strip(),
+                                       duration, stations.lower().split())
+            elif line.startswith('SOURCE:'):
+                yield ('source', *decode_source(line[7:]))
+            elif line.startswith('SESSION:'):
+                info = line.split('|')
+                version = info[-1].strip() if len(info) > 2 else ''
+                yield 'session', info[0][8:].strip().lower(), decode_time(info[1].strip()), version
+
+
+# Parse schedule file. If sta_id is provided, only scans observed by station are kept.
+# Index of scan is its position in the list of scans of the station.
+def read(path, sta_id=None):
+    session, start, end, version, sources, scans = None, None, None, '', {}, []
+    sta_id = sta_id.lower() if sta_id else None
+    for record in stream(path):
+        if record[0] == 'scan':
+            scan = record[1]
+            end = scan.end
+            if not sta_id or sta_id in scan.stations:
+                scans.append(scan._replace(index=len(scans) + 1))
+        elif record[0] == 'source':
+            sources[record[1]] = record[2]
+        else:
+            session, start, version = record[1], record[2], record[3]
+    return Parsed(session, start, end, version, sources, scans)
+
+
+# Local index of downloaded schedules. Sessions, sources and scans of every station are stored when the file is
+# added so that information and station scans are read without parsing the file again.
+class ScheduleStore:
+    version = 2  # Version of database schema. Files are indexed again when it changes.
+
+    def __init__(self, path, max_cached=8):
+        self.lock = Lock()
+        self.cache, self.max_cached = OrderedDict(), max_cached  # Recently loaded schedules by (path, sta_id)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != self.version:
+            self.db.executescript('DROP TABLE IF EXISTS schedules; DROP TABLE IF EXISTS sources; '
+                                  'DROP TABLE IF EXISTS scans; DROP TABLE IF EXISTS stations;')
+            self.db.execute(f'PRAGMA user_version = {self.version}')
+        self.db.executescript(
+            'CREATE TABLE IF NOT EXISTS schedules (path TEXT PRIMARY KEY, session TEXT, start TEXT, end TEXT, '
+            'version TEXT, size INTEGER, mtime REAL);'
+            'CREATE INDEX IF NOT EXISTS schedules_session ON schedules (session);'
+            'CREATE TABLE IF NOT EXISTS sources (path TEXT, name TEXT, text TEXT, PRIMARY KEY (path, name));'
+            'CREATE TABLE IF NOT EXISTS scans (path TEXT, scan INTEGER, start TEXT, end TEXT, source TEXT, '
+            'name TEXT, duration INTEGER, stations TEXT, PRIMARY KEY (path, scan)) WITHOUT ROWID;'
+            'CREATE TABLE IF NOT EXISTS stations (path TEXT, station TEXT, idx INTEGER, scan INTEGER, '
+            'PRIMARY KEY (path, station, idx)) WITHOUT ROWID;'
+        )
+        self.db.commit()
+
+    # Index schedule file and return its information
+    def add(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        session, start, end, version, sources, scans, stations, indexes = None, None, None, '', [], [], [], {}
+        for record in stream(path):
+            if record[0] == 'scan':
+                scan, number = record[1], len(scans) + 1
+                end = scan.end
+                scans.append((path, number, str(scan.start), str(scan.end), scan.source, scan.name, scan.duration,
+                              ' '.join(scan.stations)))
+                for sta_id in scan.stations:
+                    indexes[sta_id] = index = indexes.get(sta_id, 0) + 1
+                    stations.append((path, sta_id, index, number))
+            elif record[0] == 'source':
+                sources.append((path, record[1], record[2]))
+            else:
+                session, start, version = record[1], record[2], record[3]
+        with self.lock:
+            self.remove(path)
+            self.db.execute('INSERT INTO schedules VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            (path, session, str(start) if start else None, str(end) if end else None, version,
+                             stat.st_size, stat.st_mtime))
+            self.db.executemany('INSERT OR REPLACE INTO sources VALUES (?, ?, ?)', sources)
+            self.db.executemany('INSERT INTO scans VALUES (?, ?, ?, ?, ?, ?, ?, ?)', scans)
+            self.db.executemany('INSERT INTO stations VALUES (?, ?, ?, ?)', stations)
+            self.db.commit()
+        return Info(session, start, end, version)
+
+    # Remove schedule from index. Lock must be acquired by caller.
+    def remove(self, path):
+        for key in [key for key in self.cache if key[0] == path]:
+            self.cache.pop(key)
+        for table in ('schedules', 'sources', 'scans', 'stations'):
+            self.db.execute(f'DELETE FROM {table} WHERE path = ?', (path,))
+
+    # Return path if file is indexed and has not changed since. File is indexed again if it has been modified.
+    def check(self, path):
+        path = os.path.abspath(path)
+        with self.lock:
+            row = self.db.execute('SELECT size, mtime FROM schedules WHERE path = ?', (path,)).fetchone()
+        stat = os.stat(path)
+        if not row or row != (stat.st_size, stat.st_mtime):
+            self.add(path)
+        return path
+
+    # Session information for schedule file
+    def info(self, path):
+        path = self.check(path)
+        with self.lock:
+            row = self.db.execute('SELECT session, start, end, version FROM schedules WHERE path = ?',
+                                  (path,)).fetchone()
+        return self.make_info(*row)
+
+    # Information for the most recently modified file of a session. None if session is not indexed.
+    def find(self, session):
+        with self.lock:
+            row = self.db.execute('SELECT session, start, end, version FROM schedules WHERE session = ? '
+                                  'ORDER BY mtime DESC LIMIT 1', (session.lower(),)).fetchone()
+        return self.make_info(*row) if row else None
+
+    # Make Info from database row
+    @staticmethod
+    def make_info(session, start, end, version):
+        return Info(session, decode_time(start) if start else None, decode_time(end) if end else None, version)
+
+    # Get schedule with same content as read(path, sta_id) using index. Recently loaded schedules are kept in memory.
+    def load(self, path, sta_id=None):
+        key = (self.check(path), sta_id.lower() if sta_id else None)
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+        parsed = self.read(*key)
+        with self.lock:
+            self.cache[key] = parsed
+            while len(self.cache) > self.max_cached:
+                self.cache.popitem(last=False)
+        return parsed
+
+    # Read schedule from database. Only scans of station are selected.
+    def read(self, path, sta_id):
+        with self.lock:
+            session, start, end, version = self.db.execute('SELECT session, start, end, version FROM schedules '
+                                                           'WHERE path = ?', (path,)).fetchone()
+            sources = dict(self.db.execute('SELECT name, text FROM sources WHERE path = ?', (path,)))
+            if sta_id:  # Only scans of station using (path, station, idx) key
+                rows = self.db.execute('SELECT t.idx, s.start, s.end, s.source, s.name, s.duration, s.stations '
+                                       'FROM stations t JOIN scans s ON s.path = t.path AND s.scan = t.scan '
+                                       'WHERE t.path = ? AND t.station = ? ORDER BY t.idx',
+                                       (path, sta_id)).fetchall()
+            else:
+                rows = self.db.execute('SELECT scan, start, end, source, name, duration, stations FROM scans '
+                                       'WHERE path = ? ORDER BY scan', (path,)).fetchall()
+        scans = [Scan(index, decode_time(start), decode_time(end), source, name, duration, stations.split())
+                 for (index, start, end, source, name, duration, stations) in rows]
+        info = self.make_info(session, start, end, version)
+        return Parsed(info.session, info.start, info.end, version, sources, scans)
+
+
+_store, _lock = None, Lock()
+
+
+# Get schedule store shared by application. Folder could be defined in configuration file.
+def get_store():
+    global _store
+
+    with _lock:
+        if _store is None:
+            config = getattr(settings, 'ScheduleStore', None)
+            folder = getattr(config, 'folder', os.path.join(os.path.expanduser('~'), '.vcc'))
+            os.makedirs(folder, exist_ok=True)
+            _store = ScheduleStore(os.path.join(folder, 'schedules.db'))
+    return _store
@@ -0,0 +1,72 @@
+from collections import namedtuple
+import json
+
+try:  # Fast json backend (optional)
+    import orjson
+except ImportError:
+    orjson = None
+try:  # Compact binary format (optional)
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from vcc import json_encoder
+
+
+Serializer = namedtuple('Serializer', ['encode', 'decode'])
+
+registry = {}  # Serializer by value of format header
+preferred = ['msgpack', 'json']  # Order used to select format accepted by a receiver
+
+
+# Add serializer for a format
+def register(fmt, encode, decode):
+    registry[fmt] = Serializer(encode, decode)
+
+
+# Formats that this client can decode (sent in accept header)
+def accepted():
+    return ','.join(fmt for fmt in preferred if fmt in registry)
+
+
+# Select best format in the list accepted by a receiver. Old receivers only understand json.
+def choose(accept):
+    formats = set(accept.split(',')) if accept else set()
+    return next((fmt for fmt in preferred if fmt in formats and fmt in registry), 'json')
+
+
+# Encode data using format. Strings are always sent as text. Unknown format is sent as json.
+def encode(data, fmt='json'):
+    if isinstance(data, str):
+        return 'text', data
+    fmt = fmt if fmt in registry else 'json'
+    return fmt, registry[fmt].encode(data)
+
+
+# Decode message body using format in headers. Unknown format is decoded as text.
+def decode(headers, body):
+    serializer = registry.get(headers.get('format', 'text'), registry['text'])
+    return serializer.decode(body)
+
+
+# Decode bytes or string to text
+def to_text(body):
+    return body.decode('utf-8') if isinstance(body, (bytes, bytearray)) else body
+
+
+# Encode json with orjson. Standard library is used for data orjson does not support (integers wider than 64 bits).
+def orjson_dumps(data):
+    try:
+        return orjson.dumps(data, default=json_encoder, option=orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        return json.dumps(data, default=json_encoder)
+
+
+register('text', lambda data: data, to_text)
+if orjson:  # Same json text as standard library but much faster
+    register('json', orjson_dumps, orjson.loads)
+else:
+    register('json', lambda data: json.dumps(data, default=json_encoder), json.loads)
+if msgpack:  # Dates are encoded as iso format string like json
+    register('msgpack', lambda data: msgpack.packb(data, default=json_encoder),
+             lambda body: msgpack.unpackb(body, raw=False))
@@ -1,10 +1,14 @@
 from datetime import datetime, timedelta
 
-from vcc import make_object
+from vcc.models import Model, Schedule
 
 
-class Session:
+class Session(Model):
+    __slots__ = ('error', 'code', 'name', 'operations', 'analysis', 'correlator', 'start', 'duration', 'end',
+                 'included', 'removed', 'schedule', 'db_code', 'type')
+
     def __init__(self, data):
+        super().__init__()
         self.error = False
 
         self.code = self.name = self.operations = self.analysis = self.correlator = ''
@@ -13,7 +17,7 @@ class Session:
         self.included, self.removed = [], []
         self.schedule, self.db_code, self.type = None, '', 'standard'
 
-        make_object(data, self)
+        self.update(data)
 
         self.end = self.start + timedelta(seconds=self.duration)
 
@@ -23,7 +27,7 @@ class Session:
         return f'{self.code} {self.start} {self.end} {self.duration} {oc} {cor}'
 
     def update_schedule(self, data):
-        self.schedule = make_object(data) if data else None
+        self.schedule = Schedule(data) if data else None
 
     @property
     def network(self):
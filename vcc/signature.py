@@ -1,4 +1,7 @@
+from threading import Lock
 from time import time
+import json
+import os
 import secrets
 
 from cryptography.hazmat.primitives import serialization
@@ -9,6 +12,26 @@ from vcc import settings, VCCError
 
 secret = secrets.token_hex(8)  # secret key that will be used by VCC to create JWT token
 
+_lock = Lock()  # Signing is called from many QThreads
+_keys = {}  # Parsed private keys by path. Value is (mtime, key)
+_tokens = {}  # Signed headers by (group_id, data, exp). Value is (reuse_until, headers)
+_margin = 30  # Do not reuse a token in the last 30 seconds (or last 10%) of its life
+
+
+# Read and parse private key only if file has changed since last call
+def load_key(path):
+    mtime = os.stat(path).st_mtime
+    if path in _keys and _keys[path][0] == mtime:
+        return _keys[path][1]
+    text = open(path, 'r').read()
+    try:  # Decode file as not PEM format
+        key = serialization.load_ssh_private_key(text.encode(), password=b'')
+    except ValueError:  # It looks like file is in PEM format
+        key = text
+    _keys[path] = (mtime, key)
+    _tokens.clear()  # Tokens signed with old key are not valid anymore
+    return key
+
 
 # Make signature and encode using ssh private key
 def make(group_id, data={}, exp=0):
@@ -17,16 +40,23 @@ def make(group_id, data={}, exp=0):
     if not hasattr(settings.Signatures, group_id):
         raise VCCError(f'{group_id} not in configuration file')
 
-    code, uid = getattr(settings.Signatures, group_id)
-    data = dict(**data, **{'code': code, 'group': group_id, 'secret': secret})
-    if exp > 0:
-        data['exp'] = time() + exp
-    # use ssh private key to encode Jason Web Token
-    try:  # Decode file as not PEM format
-        key = serialization.load_ssh_private_key(open(settings.KEY, 'r').read().encode(), password=b'')
-    except ValueError:  # It looks like file is in PEM format
-        key = open(settings.KEY, 'r').read()
-    return {'token': jwt.encode(payload=data, key=key, algorithm='RS256', headers={'uid': uid})}
+    with _lock:
+        key = load_key(settings.KEY)
+        # Reuse signed header if still valid
+        name = (group_id, json.dumps(data, sort_keys=True, default=str), exp)
+        now = time()
+        if name in _tokens and now < _tokens[name][0]:
+            return dict(_tokens[name][1])
+
+        code, uid = getattr(settings.Signatures, group_id)
+        data = dict(**data, **{'code': code, 'group': group_id, 'secret': secret})
+        if exp > 0:
+            data['exp'] = now + exp
+        # use ssh private key to encode Jason Web Token
+        headers = {'token': jwt.encode(payload=data, key=key, algorithm='RS256', headers={'uid': uid})}
+        # Token without expiration could be used as long as the key is the same
+        _tokens[name] = (now + exp - min(_margin, exp / 10) if exp > 0 else float('inf'), headers)
+        return dict(headers)
 
 
 # Validate signature of information received by VCC
@@ -49,5 +79,3 @@ def validate(rsp):
         return info
     except (jwt.exceptions.ExpiredSignatureError, jwt.exceptions.InvalidSignatureError) as exc:
         raise VCCError(str(exc))
-
-
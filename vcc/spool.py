@@ -0,0 +1,79 @@
+from collections import namedtuple
+from threading import Lock
+from time import time
+import json
+import os
+import sqlite3
+
+from vcc import settings
+
+
+Spooled = namedtuple('Spooled', ['id', 'exchange', 'key', 'body', 'properties', 'expires'])
+
+
+# Durable storage of outbound messages that could not be published. Messages are replayed in order.
+class Spool:
+    def __init__(self, path, max_size=10000, ttl=86400):
+        self.max_size, self.ttl = max_size, ttl  # Maximum number of messages and default time to live (seconds)
+        self.lock = Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS outbound (id INTEGER PRIMARY KEY AUTOINCREMENT, exchange TEXT, '
+                        'key TEXT, body BLOB, properties TEXT, stored REAL, expires REAL)')
+        self.db.commit()
+
+    # Number of messages waiting to be published
+    def __len__(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM outbound').fetchone()[0]
+
+    # Store messages. Expiration (ms) in properties is used if shorter than spool ttl.
+    def put(self, messages):
+        now = time()
+        with self.lock:
+            for (exchange, key, body, properties) in messages:
+                expiration = properties.get('expiration')
+                ttl = min(self.ttl, int(expiration) / 1000) if expiration else self.ttl
+                self.db.execute('INSERT INTO outbound (exchange, key, body, properties, stored, expires) '
+                                'VALUES (?, ?, ?, ?, ?, ?)', (exchange, key, body, json.dumps(properties), now,
+                                                              now + ttl))
+            self.trim()
+            self.db.commit()
+
+    # Remove expired messages and oldest messages when spool is full
+    def trim(self):
+        self.db.execute('DELETE FROM outbound WHERE expires < ?', (time(),))
+        total = self.db.execute('SELECT COUNT(*) FROM outbound').fetchone()[0]
+        if total > self.max_size:
+            self.db.execute('DELETE FROM outbound WHERE id IN (SELECT id FROM outbound ORDER BY id LIMIT ?)',
+                            (total - self.max_size,))
+
+    # Get messages in the order they have been stored. Expiration is the time left to live.
+    def get(self, limit=100):
+        now = time()
+        with self.lock:
+            self.db.execute('DELETE FROM outbound WHERE expires < ?', (now,))
+            self.db.commit()
+            rows = self.db.execute('SELECT id, exchange, key, body, properties, expires FROM outbound '
+                                   'ORDER BY id LIMIT ?', (limit,)).fetchall()
+        messages = []
+        for (index, exchange, key, body, properties, expires) in rows:
+            properties = json.loads(properties)
+            if properties.get('expiration'):
+                properties['expiration'] = str(max(1, int((expires - now) * 1000)))
+            messages.append(Spooled(index, exchange, key, body, properties, expires))
+        return messages
+
+    # Remove messages that have been published (all messages up to last_id)
+    def remove(self, last_id):
+        with self.lock:
+            self.db.execute('DELETE FROM outbound WHERE id <= ?', (last_id,))
+            self.db.commit()
+
+
+# Get spool for a client. Folder, size and ttl could be defined in configuration file.
+def get_spool(name):
+    config = getattr(settings, 'Spool', None)
+    folder = getattr(config, 'folder', os.path.join(os.path.expanduser('~'), '.vcc'))
+    os.makedirs(folder, exist_ok=True)
+    return Spool(os.path.join(folder, f'{name}-outbound.db'), getattr(config, 'size', 10000),
+                 getattr(config, 'ttl', 86400))
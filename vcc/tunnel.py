@@ -0,0 +1,115 @@
+from threading import Lock
+
+from sshtunnel import SSHTunnelForwarder
+
+
+# SSH tunnel forwarding web service and message broker ports over same transport.
+# Port requested while other users are connected is forwarded by its own transport so that their connections
+# are not dropped.
+class Tunnel:
+    def __init__(self, manager, config):
+        self.manager, self.key = manager, (config.url, config.tunnel)
+        self.host, self.user, self.pkey = config.url, config.tunnel, config.ssh_pkey
+        # Forward all VCC ports known by config
+        self.ports = [port for port in (getattr(config, name, None) for name in ['api_port', 'msg_port']) if port]
+        self.local_ports = {}  # Local port for each remote port. Kept when transport is restarted
+        self.forwarder, self.extra, self.users, self.lock = None, {}, 0, Lock()  # extra is forwarder of other ports
+
+    # Start ssh transport forwarding ports
+    def forward(self, ports):
+        forwarder = SSHTunnelForwarder(self.host, ssh_username=self.user, ssh_pkey=self.pkey,
+                                       remote_bind_addresses=[('localhost', port) for port in ports],
+                                       local_bind_addresses=[('127.0.0.1', self.local_ports.get(port, 0))
+                                                             for port in ports]
+                                       )
+        forwarder.daemon_forward_servers = True
+        forwarder.start()
+        self.local_ports.update(zip(ports, forwarder.local_bind_ports))
+        return forwarder
+
+    # Start ssh transport and forward all ports
+    def start(self):
+        self.forwarder = self.forward(self.ports)
+
+    # Stop a ssh transport
+    @staticmethod
+    def stop_it(forwarder):
+        try:
+            if forwarder:
+                forwarder.stop()
+        except Exception as exc:
+            print('Stop tunnel failed', str(exc))
+
+    # Stop all ssh transports
+    def stop(self):
+        for forwarder in [self.forwarder, *self.extra.values()]:
+            self.stop_it(forwarder)
+        self.forwarder, self.extra = None, {}
+
+    # Check if ssh transport is still active
+    @property
+    def is_active(self):
+        return bool(self.forwarder and self.forwarder.is_active)
+
+    # Restart ssh transport if it has failed
+    def check(self):
+        with self.lock:
+            if not self.is_active:
+                self.stop_it(self.forwarder)
+                self.start()
+
+    # Get local port forwarded to remote port. Restart tunnel if transport failed.
+    # New port is added to main transport only if nobody else is using it.
+    def local_port(self, port):
+        with self.lock:
+            if port in self.extra:
+                if not (forwarder := self.extra[port]).is_active:
+                    self.stop_it(forwarder)
+                    self.extra[port] = self.forward([port])
+                return self.local_ports[port]
+            if port not in self.ports:
+                if self.users > 1 and self.is_active:
+                    self.extra[port] = self.forward([port])
+                    return self.local_ports[port]
+                self.ports.append(port)
+                self.stop_it(self.forwarder)
+                self.forwarder = None
+        self.check()
+        return self.local_ports[port]
+
+    # Decrease number of users and stop tunnel if nobody is using it
+    def release(self):
+        self.manager.release(self)
+
+
+# Keep one tunnel per host shared by all clients
+class TunnelManager:
+    def __init__(self):
+        self.tunnels, self.lock = {}, Lock()
+
+    # Get tunnel for host in config and increase number of users
+    def get(self, config):
+        with self.lock:
+            key = (config.url, config.tunnel)
+            if not (tunnel := self.tunnels.get(key)):
+                self.tunnels[key] = tunnel = Tunnel(self, config)
+            tunnel.users += 1
+        return tunnel
+
+    # Decrease number of users and stop tunnel if nobody is using it
+    def release(self, tunnel):
+        with self.lock:
+            tunnel.users -= 1
+            if tunnel.users > 0:
+                return
+            if self.tunnels.get(tunnel.key) == tunnel:
+                self.tunnels.pop(tunnel.key)
+        tunnel.stop()
+
+
+manager = TunnelManager()
+
+
+# Get the shared tunnel to VCC host. Caller must release it when done.
+def get_tunnel(config):
+    return manager.get(config)
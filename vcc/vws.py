@@ -1,15 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import ContextVar
+from threading import Lock, local
+from time import time, perf_counter
+import asyncio
+import atexit
+import base64
+import hashlib
+import json
+import os
+import re
+
+import aiohttp
 import requests
 
-from sshtunnel import SSHTunnelForwarder
-from urllib.parse import urljoin
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+from urllib.parse import urljoin, urlencode
 
-from vcc import make_object, settings, signature, json_encoder, VCCError
+from vcc import settings, signature, json_encoder, VCCError
+from vcc.models import Credentials
+from vcc.cache import get_cache
+from vcc.tunnel import get_tunnel
 
 
 # Class to connect to VCC Web Service VWS
 class VWSclient:
     def __init__(self, config, group_id, keep_alive=False):
-        self.tunnel, self.session, self.base_url, self.jwt_data = None, None, None, None
+        self.tunnel, self.session, self.base_url = None, None, None
+        self._local = local()  # jwt_data is specific to the thread making the request
+        self.failed, self.last_contact = False, 0
+        self.cache = get_cache()  # Local cache of responses. None if not in configuration file
         # Copy elements of web_service into VWSclient class
         self._config, self.group_id, self.keep_alive = config, group_id, keep_alive
 
@@ -32,17 +52,30 @@ class VWSclient:
     def config(self):
         return self._config.__dict__
 
+    # Signature data of last response received by this thread
+    @property
+    def jwt_data(self):
+        return getattr(self._local, 'jwt_data', None)
+
+    @jwt_data.setter
+    def jwt_data(self, data):
+        self._local.jwt_data = data
+
+    # Check if client has been used successfully in the last idle_time seconds
+    def is_healthy(self, idle_time):
+        return self.session and not self.failed and time() - self.last_contact < idle_time
+
+    # Keep time of successful contact with web service
+    def contacted(self, rsp):
+        self.failed, self.last_contact = False, time()
+        return rsp
+
     # Connect to VCC
     def connect(self):
         url, port = self._config.url, self._config.api_port
-        if hasattr(self._config, 'tunnel'):
-            self.tunnel = SSHTunnelForwarder(self._config.url, ssh_username=self._config.tunnel,
-                                             ssh_pkey=self._config.ssh_pkey,
-                                             remote_bind_address=('localhost', port)
-                                             )
-            self.tunnel.daemon_forward_servers = True
-            self.tunnel.start()
-            url, port = '127.0.0.1', self.tunnel.local_bind_port
+        if hasattr(self._config, 'tunnel'):  # Use tunnel shared with other clients (restarted if failed)
+            self.tunnel = self.tunnel if self.tunnel else get_tunnel(self._config)
+            url, port = '127.0.0.1', self.tunnel.local_port(port)
 
         self.base_url = f'{self._config.protocol}://{url}:{port}'
         self.session = requests.Session()
@@ -60,7 +93,7 @@ class VWSclient:
                 self.session.close()
             self.session = None
             if self.tunnel:
-                self.tunnel.stop()
+                self.tunnel.release()
             self.tunnel = None
         except Exception as exc:
             print('Close failed', str(exc))
@@ -75,28 +108,59 @@ class VWSclient:
         return False
 
     # GET data from web service
-    def get(self, path, params=None, headers=None, timeout=None, retries=0):
+    def get(self, path, params=None, headers=None, timeout=None, retries=0, use_cache=True):
+        if use_cache and self.cache and not headers and (ttl := self.cache.get_ttl(path)) is not None:
+            return self.get_cached(path, params, timeout, ttl)
         try:
             rsp = self.session.get(url=urljoin(self.base_url, path), params=params, headers=headers, timeout=timeout)
             self.jwt_data = signature.validate(rsp) if rsp and path != '/' else None
-            return rsp
+            return self.contacted(rsp)
         except requests.exceptions.ConnectionError:
             if self.session and self.keep_alive and retries < 3:
                 self.connect()
-                return self.get(path, params=params, headers=headers, timeout=timeout, retries=retries+1)
+                return self.get(path, params=params, headers=headers, timeout=timeout, retries=retries+1,
+                                use_cache=False)
+        self.failed = True
         return None
 
+    # GET data from local cache. Revalidate with web service when time to live has expired.
+    # Only responses with valid signature are cached. Their signature data is restored when they are used.
+    def get_cached(self, path, params, timeout, ttl):
+        key, headers = self.cache.make_key(self.group_id, path, params), None
+        if (cached := self.cache.get(key)) and not cached.jwt_data:  # Stored before signature data was kept
+            cached = None
+        if cached:
+            if time() - cached.stored < ttl:
+                self.jwt_data = cached.jwt_data
+                return make_response(urljoin(self.base_url, path), cached.status, cached.headers, cached.content)
+            headers = {name: cached.headers[code] for name, code in [('If-None-Match', 'ETag'),
+                                                                      ('If-Modified-Since', 'Last-Modified')]
+                       if code in cached.headers}
+        rsp = self.get(path, params=params, headers=headers, timeout=timeout, use_cache=False)
+        if cached and (rsp is None or rsp.status_code == requests.codes.not_modified):
+            if rsp is not None:  # Still valid
+                self.cache.touch(key)
+            else:
+                self.jwt_data = cached.jwt_data
+            # Use cached response if not modified or web service could not be reached
+            return make_response(urljoin(self.base_url, path), cached.status, cached.headers, cached.content)
+        if rsp is not None and rsp.status_code == requests.codes.ok:
+            self.cache.put(key, path, rsp, self.jwt_data)
+        return rsp
+
     # POST data to web service
     def post(self, path, data=None, files=None, headers=None, retries=0):
         try:
             rsp = self.session.post(url=urljoin(self.base_url, path), json=json_encoder(data), files=files,
                                     headers=headers)
             self.jwt_data = signature.validate(rsp) if rsp else None
-            return rsp
+            self.invalidate(path, rsp)
+            return self.contacted(rsp)
         except requests.exceptions.ConnectionError:
             if self.session and self.keep_alive and retries < 3:
                 self.connect()
                 return self.post(path, data=data, files=files, headers=headers, retries=retries+1)
+        self.failed = True
         return None
 
     # PUT data to web service
@@ -105,11 +169,13 @@ class VWSclient:
             rsp = self.session.put(url=urljoin(self.base_url, path), json=json_encoder(data), files=files,
                                    headers=headers)
             self.jwt_data = signature.validate(rsp) if rsp else None
-            return rsp
+            self.invalidate(path, rsp)
+            return self.contacted(rsp)
         except requests.exceptions.ConnectionError:
             if self.session and self.keep_alive and retries < 3:
                 self.connect()
                 return self.put(path, data=data, files=files, headers=headers, retries=retries + 1)
+        self.failed = True
         return None
 
     # DELETE data from web service
@@ -117,32 +183,477 @@ class VWSclient:
         try:
             rsp = self.session.delete(url=urljoin(self.base_url, path), headers=headers)
             self.jwt_data = signature.validate(rsp) if rsp else None
-            return rsp
+            self.invalidate(path, rsp)
+            return self.contacted(rsp)
         except requests.exceptions.ConnectionError:
             if self.session and self.keep_alive and retries < 3:
                 self.connect()
                 return self.delete(path, headers=headers, retries=retries + 1)
+        self.failed = True
         return None
 
+    # GET many paths at same time. items is dictionary of key: (path, params).
+    # Yield (key, response) as soon as each response is received. Requests not started are cancelled if the
+    # caller stops iterating.
+    def get_many(self, items, max_workers=8, timeout=None):
+        # Get response or None if signature is not valid
+        def get_one(path, params):
+            try:
+                return self.get(path, params=params, timeout=timeout)
+            except VCCError:
+                return None
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        futures = {executor.submit(get_one, path, params): key for key, (path, params) in items.items()}
+        try:
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    # Download file to folder without keeping content in memory. Content is written in temporary .part file that is
+    # renamed when complete and valid. Interrupted download is resumed from end of .part file using Range request.
+    # Checksum is 'algorithm:hexdigest' or taken from Digest header of complete response. Return path of file.
+    def download(self, path, folder, params=None, filename=None, checksum=None, chunk_size=65536, timeout=60,
+                 retries=3):
+        os.makedirs(folder, exist_ok=True)
+        key = f'{self.group_id}:{path}?{urlencode(sorted((clean_items(params) or {}).items()))}'
+        part = os.path.join(folder, f'.{hashlib.sha1(key.encode()).hexdigest()[:16]}.part')
+        for attempt in range(retries + 1):
+            try:
+                info = self.download_part(path, params, part, chunk_size, timeout)
+                break
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout) as exc:
+                self.failed = True
+                if attempt == retries:
+                    raise VCCError(f'Download {path} failed [{str(exc)}]')
+                if self.session and self.keep_alive:
+                    self.connect()
+        if not (filename := filename or info.get('filename')):
+            remove_part(part)
+            raise VCCError(f'Download {path} failed [no file name]')
+        algorithm, expected = checksum.split(':', 1) if checksum else (info.get('algorithm'), info.get('checksum'))
+        if expected and file_digest(part, algorithm) != expected.lower():
+            remove_part(part)
+            raise VCCError(f'Download {path} failed [invalid {algorithm} checksum]')
+        destination = os.path.join(folder, os.path.basename(filename))
+        os.replace(part, destination)
+        remove_part(part)
+        return destination
+
+    # Write body of response in part file. Resume at end of part file if content has not changed on web service.
+    # Return information of complete response (validator, file name and checksum) saved with part file.
+    def download_part(self, path, params, part, chunk_size, timeout):
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        info = read_part_info(part) if offset else {}
+        headers = {'Range': f'bytes={offset}-', 'If-Range': info['validator']} if info.get('validator') else None
+        with self.session.get(url=urljoin(self.base_url, path), params=params, headers=headers, timeout=timeout,
+                              stream=True) as rsp:
+            if rsp.status_code == requests.codes.requested_range_not_satisfiable and headers:
+                remove_part(part)  # Part file is not valid anymore. Download everything.
+                return self.download_part(path, params, part, chunk_size, timeout)
+            if rsp.status_code not in (requests.codes.ok, requests.codes.partial_content):
+                raise VCCError(f'Download {path} failed [{rsp.status_code}] [{rsp.reason}]')
+            self.jwt_data = signature.validate(rsp)
+            if rsp.status_code == requests.codes.partial_content:
+                if not headers:
+                    raise VCCError(f'Download {path} failed [partial content not requested]')
+                if range_start(rsp.headers) != offset:  # Content would not be appended at the right place
+                    remove_part(part)
+                    return self.download_part(path, params, part, chunk_size, timeout)
+            else:  # Complete file. Digest and name are only valid for complete response.
+                remove_part(part)
+                algorithm, checksum = get_checksum(rsp.headers)
+                found = extract_name(rsp.headers.get('content-disposition', ''))
+                info = {'validator': rsp.headers.get('etag', rsp.headers.get('last-modified')),
+                        'filename': found['name'] if found else None, 'algorithm': algorithm, 'checksum': checksum}
+                with open(f'{part}.info', 'w') as file:
+                    json.dump(info, file)
+            with open(part, 'ab') as file:
+                for chunk in rsp.iter_content(chunk_size):
+                    file.write(chunk)
+            self.contacted(rsp)
+            return info
+
+    # Remove cached responses having same prefix as path modified on web service
+    def invalidate(self, path, rsp):
+        if rsp and self.cache and (prefix := self.cache.get_prefix(path)):
+            self.cache.invalidate(prefix)
+
     # Get credentials from VCC api to access inbox
     def get_inbox_credentials(self, session=None):
         # Connect to VCC to get username and password to connect to message broker
         try:
             rsp = self.get('/users/inbox', headers={'session': session})
             if rsp:  # Combined client config with information in signature
-                return make_object(dict(**self.config, **self.jwt_data))
+                return Credentials(dict(**self.config, **self.jwt_data))
             raise VCCError(f'Problem at VCC api [{rsp.status_code}] [{rsp.text}]')
         except VCCError as exc:
             raise VCCError(str(exc))
 
 
-# Get first available VWS client
-def get_client(group_id, keep_alive=False):
-    # Get list of VLBI Communications Center (VCC)
-    if hasattr(settings, 'VCC'):
-        for name, config in settings.VCC.__dict__.items():
-            setattr(config, 'ssh_pkey', settings.KEY)
-            client = VWSclient(config, group_id, keep_alive=keep_alive)
-            if client and client.is_available:
+# Make a requests.Response with data received by another transport so that callers see the same object
+def make_response(url, status, headers, content, reason=''):
+    rsp = requests.Response()
+    rsp.url, rsp.status_code, rsp.reason, rsp._content = url, status, reason, content
+    rsp.headers = CaseInsensitiveDict(headers)
+    rsp.encoding = get_encoding_from_headers(rsp.headers)
+    return rsp
+
+
+# Extract file name from content-disposition header
+extract_name = re.compile('.*filename=\"(?P<name>.*)\".*').match
+
+
+# Get (algorithm, hexdigest) from Digest or Content-MD5 header. Return (None, None) if not available.
+def get_checksum(headers):
+    names = {'sha-512': 'sha512', 'sha-256': 'sha256', 'sha': 'sha1', 'md5': 'md5'}
+    digests = dict(item.strip().split('=', 1) for item in headers.get('digest', '').split(',') if '=' in item)
+    digests = {name.lower(): value for name, value in digests.items()}
+    if 'content-md5' in headers:
+        digests.setdefault('md5', headers['content-md5'])
+    for name, algorithm in names.items():
+        if name in digests:
+            return algorithm, base64.b64decode(digests[name]).hex()
+    return None, None
+
+
+# First byte of partial content from Content-Range header. None if header is not valid.
+def range_start(headers):
+    found = re.match(r'bytes\s+(\d+)-', headers.get('content-range', ''))
+    return int(found.group(1)) if found else None
+
+
+# Information saved with part file of a download
+def read_part_info(part):
+    try:
+        with open(f'{part}.info') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+# Compute hexdigest of file content
+def file_digest(path, algorithm):
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as file:
+        while chunk := file.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Remove temporary files of a download
+def remove_part(part):
+    for path in (part, f'{part}.info'):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+# Remove None values like requests does and change other values to string
+def clean_items(items):
+    return {key: str(value) for key, value in items.items() if value is not None} if items else None
+
+
+# Class to connect to VCC Web Service VWS using asyncio
+class AsyncVWSclient:
+    def __init__(self, config, group_id, keep_alive=False, concurrency=20):
+        self.tunnel, self.session, self.base_url = None, None, None
+        self._jwt_data = ContextVar(f'jwt_data_{id(self)}', default=None)  # Specific to each task
+        # Copy elements of web_service into AsyncVWSclient class
+        self._config, self.group_id, self.keep_alive = config, group_id, keep_alive
+        # Maximum number of requests running at same time
+        self.concurrency, self.semaphore = concurrency, None
+        # Session is replaced by only one of the requests failing on it (generation is number of sessions)
+        self.generation, self.reconnecting = 0, None
+
+    # Enter function when 'async with' is used
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    # Exit function when 'async with' is used
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    # Get config for this client
+    @property
+    def config(self):
+        return self._config.__dict__
+
+    # Signature data of last response received by this task
+    @property
+    def jwt_data(self):
+        return self._jwt_data.get()
+
+    @jwt_data.setter
+    def jwt_data(self, data):
+        self._jwt_data.set(data)
+
+    # Get local port of tunnel (blocking since tunnel could be restarted)
+    def get_tunnel_port(self, port):
+        self.tunnel = self.tunnel if self.tunnel else get_tunnel(self._config)
+        return self.tunnel.local_port(port)
+
+    # Connect to VCC
+    async def connect(self):
+        url, port = self._config.url, self._config.api_port
+        if hasattr(self._config, 'tunnel'):  # Use tunnel shared with other clients (restarted if failed)
+            url, port = '127.0.0.1', await asyncio.get_running_loop().run_in_executor(None, self.get_tunnel_port, port)
+
+        self.base_url = f'{self._config.protocol}://{url}:{port}'
+        if self.session:
+            await self.session.close()
+        if not self.semaphore:  # Requests waiting for it are not released when reconnecting
+            self.semaphore, self.reconnecting = asyncio.Semaphore(self.concurrency), asyncio.Lock()
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.concurrency),
+                                             headers=signature.make(self.group_id))
+        self.generation += 1
+
+    # Reconnect if session used by failed request has not been replaced already
+    async def reconnect(self, generation):
+        async with self.reconnecting:
+            if generation == self.generation:
+                await self.connect()
+
+    # Check if site is available by requesting a welcome message
+    async def is_available(self):
+        return await self.welcome()
+
+    # Close all connection
+    async def close(self):
+        try:
+            if self.session:
+                await self.session.close()
+            self.session = None
+            if self.tunnel:
+                self.tunnel.release()
+            self.tunnel = None
+        except Exception as exc:
+            print('Close failed', str(exc))
+
+    # Check if web service is returning the welcome message
+    async def welcome(self):
+        rsp = await self.get('/', timeout=5)  # Not more than 5 seconds to look for web service
+        if rsp:
+            return 'Welcome to VLBI Coordinations Center' in rsp.text
+        return False
+
+    # Send request to web service. Reconnect and retry if keep_alive.
+    # Like VWSclient, only connection errors are retried. Request that timed out may have been processed.
+    async def request(self, method, path, retries=0, timeout=None, **kwargs):
+        try:
+            async with self.semaphore:
+                generation = self.generation
+                async with self.session.request(method, urljoin(self.base_url, path),
+                                                timeout=aiohttp.ClientTimeout(total=timeout), **kwargs) as rsp:
+                    rsp = make_response(str(rsp.url), rsp.status, rsp.headers, await rsp.read(), rsp.reason)
+        except asyncio.TimeoutError:
+            return None
+        except aiohttp.ClientConnectionError:
+            if self.session and self.keep_alive and retries < 3:
+                await self.reconnect(generation)
+                return await self.request(method, path, retries=retries+1, timeout=timeout, **kwargs)
+            return None
+        self.jwt_data = signature.validate(rsp) if rsp and path != '/' else None
+        return rsp
+
+    # Make body of POST or PUT request
+    @staticmethod
+    def make_body(data, files):
+        if not files:
+            return {'json': json_encoder(data)}
+        form = aiohttp.FormData()
+        for name, (filename, file) in files.items():
+            form.add_field(name, file, filename=filename)
+        return {'data': form}
+
+    # GET data from web service
+    async def get(self, path, params=None, headers=None, timeout=None):
+        return await self.request('GET', path, timeout=timeout, params=clean_items(params),
+                                  headers=clean_items(headers))
+
+    # POST data to web service
+    async def post(self, path, data=None, files=None, headers=None):
+        return await self.request('POST', path, headers=clean_items(headers), **self.make_body(data, files))
+
+    # PUT data to web service
+    async def put(self, path, data=None, files=None, headers=None):
+        return await self.request('PUT', path, headers=clean_items(headers), **self.make_body(data, files))
+
+    # DELETE data from web service
+    async def delete(self, path, headers=None):
+        return await self.request('DELETE', path, headers=clean_items(headers))
+
+    # Get credentials from VCC api to access inbox
+    async def get_inbox_credentials(self, session=None):
+        # Connect to VCC to get username and password to connect to message broker
+        rsp = await self.get('/users/inbox', headers={'session': session})
+        if rsp:  # Combined client config with information in signature
+            return Credentials(dict(**self.config, **self.jwt_data))
+        raise VCCError(f'Problem at VCC api [{rsp.status_code if rsp else "no response"}]'
+                       f' [{rsp.text if rsp else ""}]')
+
+
+# Health of a VCC web service measured by probing it with welcome message
+class Health:
+    max_failures = 3  # Number of consecutive failures before VCC is not probed anymore
+    open_time, max_open_time = 30, 600  # Time VCC is not probed after too many failures
+
+    def __init__(self, name):
+        self.name = name
+        self.latency, self.failures, self.total_failures = None, 0, 0
+        self.checked, self.open_until = 0, 0
+
+    # Circuit is open when VCC failed too many times. It is not probed until open_until
+    @property
+    def is_open(self):
+        return time() < self.open_until
+
+    # Check if health information is recent
+    def is_fresh(self, ttl):
+        return self.latency is not None and time() - self.checked < ttl
+
+    # Update health with result of probe
+    def update(self, ok, latency):
+        self.checked = time()
+        if ok:
+            self.latency, self.failures, self.open_until = latency, 0, 0
+        else:
+            self.latency, self.failures, self.total_failures = None, self.failures + 1, self.total_failures + 1
+            if self.failures >= self.max_failures:
+                dt = min(self.open_time * 2 ** (self.failures - self.max_failures), self.max_open_time)
+                self.open_until = self.checked + dt
+
+    # Health information as dictionary
+    def info(self):
+        return {'latency': self.latency, 'failures': self.failures, 'total_failures': self.total_failures,
+                'checked': self.checked, 'open': self.is_open}
+
+
+# Thread safe registry of VWSclient shared by all requests of the process
+class ClientPool:
+    def __init__(self, idle_time=60, health_ttl=300):
+        self.idle_time = idle_time  # Probe web service again after idle_time seconds without contact
+        self.health_ttl = health_ttl  # Probe all VCC again to rank them after health_ttl seconds
+        self.clients, self.locks, self.health, self.lock = {}, {}, {}, Lock()
+
+    # Get lock for specific client so that only one thread is probing it
+    def get_lock(self, key):
+        with self.lock:
+            return self.locks.setdefault(key, Lock())
+
+    # Get health information for a VCC
+    def get_health(self, name):
+        with self.lock:
+            return self.health.setdefault(name, Health(name))
+
+    # Get fastest available VWS client
+    def get(self, group_id, keep_alive=False):
+        # Get list of VLBI Communications Center (VCC)
+        vcc = settings.VCC.__dict__ if hasattr(settings, 'VCC') else {}
+        # Use client of fastest VCC if it is still healthy
+        ranked = sorted([health for name in vcc if (health := self.get_health(name)).is_fresh(self.health_ttl)],
+                        key=lambda health: health.latency)
+        for health in ranked:
+            if (client := self.clients.get((group_id, health.name))) and client.is_healthy(self.idle_time):
+                client.keep_alive = client.keep_alive or keep_alive
+                return client
+        # Probe all VCC at same time. Try VCC with open circuit only if all others have failed
+        names = [name for name in vcc if not self.get_health(name).is_open] or list(vcc.keys())
+        if names:
+            executor = ThreadPoolExecutor(max_workers=len(names))
+            probes = [executor.submit(self.probe, group_id, name, vcc[name], keep_alive) for name in names]
+            executor.shutdown(wait=False)  # Slower probes will update health table in background
+            for probe in as_completed(probes):
+                if client := probe.result():
+                    return client
+        raise VCCError('could not connect to VCC api')
+
+    # Probe VCC and keep client if web service is available
+    def probe(self, group_id, name, config, keep_alive):
+        key = (group_id, name)
+        with self.get_lock(key):
+            client, start, ok = self.clients.get(key), perf_counter(), False
+            try:
+                if not client:
+                    setattr(config, 'ssh_pkey', settings.KEY)
+                    client = VWSclient(config, group_id, keep_alive=keep_alive)
+                client.keep_alive = client.keep_alive or keep_alive
+                start = perf_counter()  # Latency is only the time to get welcome message
+                ok = client.is_available
+            except Exception as exc:
+                print(f'Probe {name} failed', str(exc))
+            self.get_health(name).update(ok, perf_counter() - start)
+            if ok:
+                self.clients[key] = client
                 return client
+            if self.clients.get(key) is client:  # remove closes client
+                self.remove(key)
+            elif client:
+                client.close()
+            return None
+
+    # Remove client from pool and close its connections
+    def remove(self, key):
+        if client := self.clients.pop(key, None):
+            client.close()
+
+    # Close all clients
+    def close(self):
+        for key in list(self.clients.keys()):
+            self.remove(key)
+
+
+pool = ClientPool()
+atexit.register(pool.close)
+
+
+# Get fastest available VWS client from pool. Client is shared and should not be closed by caller.
+def get_client(group_id, keep_alive=False):
+    return pool.get(group_id, keep_alive=keep_alive)
+
+
+# Get latency and failures for each VCC
+def get_health():
+    return {name: health.info() for name, health in pool.health.items()}
+
+
+# Get fastest available asyncio VWS client. Caller must close it.
+async def get_async_client(group_id, keep_alive=False, concurrency=20):
+    # Probe all VCC at same time and keep first one answering
+    async def probe(name, config):
+        setattr(config, 'ssh_pkey', settings.KEY)
+        client, start, ok = AsyncVWSclient(config, group_id, keep_alive, concurrency), perf_counter(), False
+        try:
+            await client.connect()
+            start = perf_counter()
+            ok = await client.is_available()
+        except Exception as exc:
+            print(f'Probe {name} failed', str(exc))
+        pool.get_health(name).update(ok, perf_counter() - start)
+        if ok:
+            return client
+        await client.close()
+        return None
+
+    vcc = settings.VCC.__dict__ if hasattr(settings, 'VCC') else {}
+    names = [name for name in vcc if not pool.get_health(name).is_open] or list(vcc.keys())
+    probes = [asyncio.ensure_future(probe(name, vcc[name])) for name in names]
+    found = None
+    for task in asyncio.as_completed(probes):
+        if found := await task:
+            break
+
+    # Close clients of slower VCC when they are done
+    def close_slower(task):
+        if (client := task.result()) and client is not found:
+            asyncio.ensure_future(client.close())
+
+    for task in probes:
+        task.add_done_callback(close_slower)
+    if found:
+        return found
     raise VCCError('could not connect to VCC api')